@@ -1,17 +1,27 @@
-import os
 import sys
+import math
 import time
 import uuid
-import random
+import json
 import logging
 import asyncio
 from typing import Optional, Union
 import argparse
-from quart import Quart, request, jsonify
-from camoufox.async_api import AsyncCamoufox
-from patchright.async_api import async_playwright
-from db_results import init_db, save_result, load_result, cleanup_old_results
+from urllib.parse import urlsplit
+from quart import Quart, request, jsonify, make_response
+from db_results import init_db, save_result, load_result, cleanup_old_results, close_db, ResultTTL, TaskRecord, TaskStatus
 from browser_configs import browser_config
+from browser_backends import BROWSER_TYPES, create_backend
+from token_stock import TokenStock
+from context_pool import WarmContextPool, ReusePolicy
+from browser_supervisor import BrowserSupervisor, RecyclePolicy
+from autoscaler import PoolAutoscaler
+from site_profiles import SiteProfileCache
+from worker_pool import WorkerPool
+from proxy_manager import ProxyManager, parse_proxy
+from response_cache import ResponseCache
+from metrics import SolverMetrics
+from task_trace import TaskTrace, TraceBuffer
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
@@ -19,6 +29,68 @@ from rich.align import Align
 from rich import box
 
 
+# Upper bound for the ?wait= long-poll on /result
+MAX_RESULT_WAIT = 30
+# Maximum number of items accepted by /createTasks and /getTaskResults
+MAX_BATCH_SIZE = 500
+# Per-subscriber buffer and keep-alive interval for the /stream SSE endpoint
+STREAM_QUEUE_SIZE = 1000
+STREAM_HEARTBEAT = 15
+# Token read on every wait timeout, in case a widget callback never reached the binding: one evaluate for all token inputs
+TOKEN_INPUT_SCRIPT = """
+() => Array.from(document.querySelectorAll('input[name="cf-turnstile-response"]'))
+    .map(input => input.value)
+    .find(value => value) || null
+"""
+# One-shot DOM probe: bounding boxes of all Turnstile widget and iframe candidates,
+# including those inside the closed shadow root captured by _antishadow_inject
+TURNSTILE_PROBE_SCRIPT = """
+() => {
+    const roots = [document];
+    if (window.__lastClosedShadowRoot) roots.push(window.__lastClosedShadowRoot);
+    const collect = (selector) => {
+        const boxes = [];
+        for (const root of roots) {
+            for (const element of root.querySelectorAll(selector)) {
+                const rect = element.getBoundingClientRect();
+                if (rect.width > 0 && rect.height > 0) {
+                    boxes.push({x: rect.x, y: rect.y, width: rect.width, height: rect.height});
+                }
+            }
+        }
+        return boxes;
+    };
+    const widgets = {};
+    for (const selector of ['.cf-turnstile', '[data-sitekey]', 'div[id*="turnstile"]', '*[class*="turnstile"]']) {
+        widgets[selector] = collect(selector);
+    }
+    return {
+        widgets: widgets,
+        iframes: collect('iframe[src*="challenges.cloudflare.com"], iframe[src*="turnstile"], iframe[title*="widget"]')
+    };
+}
+"""
+# Document served for the target URL in --origin-stub mode; the widget is injected into its body
+ORIGIN_STUB_HTML = "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title></title></head><body></body></html>"
+# localStorage, sessionStorage and IndexedDB of one frame's origin, cleared before a context is reused
+CLEAR_STORAGE_SCRIPT = """
+async () => {
+    try { localStorage.clear(); } catch (e) {}
+    try { sessionStorage.clear(); } catch (e) {}
+    try {
+        if (indexedDB.databases) {
+            for (const database of await indexedDB.databases()) indexedDB.deleteDatabase(database.name);
+        }
+    } catch (e) {}
+}
+"""
+# Token polls of a solve (about 40s) and of an origin-stub try (about 12s) before it falls back to real navigation
+SOLVE_ATTEMPTS = 30
+ORIGIN_STUB_ATTEMPTS = 12
+# How often the warm token stock checks for missing tokens
+STOCK_REFILL_INTERVAL = 1
+# Seconds between sweeps of expired results
+RESULT_EXPIRE_INTERVAL = 10
 
 COLORS = {
     'MAGENTA': '\033[35m',
@@ -56,17 +128,21 @@ logging.setLoggerClass(CustomLogger)
 logger: CustomLogger = logging.getLogger("TurnstileAPIServer")  # type: ignore
 logger.setLevel(logging.DEBUG)
 handler = logging.StreamHandler(sys.stdout)
-logger.addHandler(handler)
+if not logger.handlers:
+    # Worker processes import this module twice (as __mp_main__ and as api_solver)
+    logger.addHandler(handler)
 
 
 class TurnstileAPIServer:
 
-    def __init__(self, headless: bool, useragent: Optional[str], debug: bool, browser_type: str, thread: int, proxy_support: bool, use_random_config: bool = False, browser_name: Optional[str] = None, browser_version: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(self, headless: bool, useragent: Optional[str], debug: bool, browser_type: str, thread: int, proxy_support: bool, use_random_config: bool = False, browser_name: Optional[str] = None, browser_version: Optional[str] = None, api_key: Optional[str] = None, max_queue: int = 200, queue_timeout: float = 60, stock_file: Optional[str] = None, stock_ttl: float = 240, prewarm_contexts: int = 1, site_profiles: int = 1000, result_db: Optional[str] = None, result_ttl: float = 300, task_ttl: float = 600, max_results: int = 100000, recycle_solves: int = 1000, recycle_age: float = 3600, recycle_rss: float = 0, min_threads: Optional[int] = None, max_threads: Optional[int] = None, memory_budget: float = 0, browser_memory: float = 400, proxy_file: str = 'proxies.txt', proxy_sticky: bool = False, proxy_quarantine: float = 60, context_uses: int = 1, context_max_age: float = 300, context_keep_cookies: bool = False, context_keep_storage: bool = False, response_cache: float = 64, origin_stub: bool = False, trace_buffer: int = 1000, host_map: Optional[list] = None, sim_solve_time: str = 'lognormal:2,0.5', sim_fail_rate: float = 0.0, sim_crash_rate: float = 0.0, worker_pool: Optional[WorkerPool] = None):
         self.app = Quart(__name__)
         self.debug = debug
         self.browser_type = browser_type
         self.headless = headless
-        self.thread_count = thread
+        # Pool size bounds; without --min/--max-threads the pool stays at --thread browsers
+        self.min_threads = max(1, min_threads or thread)
+        self.max_threads = max(max_threads or thread, self.min_threads)
         self.proxy_support = proxy_support
         self.browser_pool = asyncio.Queue()
         self.use_random_config = use_random_config
@@ -74,6 +150,73 @@ class TurnstileAPIServer:
         self.browser_version = browser_version
         self.console = Console()
         self.api_key = api_key  # API Key 验证
+        self.result_db = result_db
+        self.result_ttl = ResultTTL(task=task_ttl, token=result_ttl, max_entries=max_results)
+
+        # Admission control: tasks waiting for a free browser
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.queue_depth = 0
+        self._avg_solve_time = 10.0
+        self._background_tasks = set()
+
+        # Long-poll: task_id -> future resolved once the task has a final result
+        self._result_waiters = {}
+        # Result streaming: subscriber queue -> set of task ids (None = all tasks)
+        self._subscribers = {}
+
+        # Warm stock of pre-solved tokens for configured (url, sitekey, action, cdata)
+        self.token_stock = TokenStock.from_file(stock_file, ttl=stock_ttl) if stock_file else None
+
+        # Ready contexts per browser so a task does not pay new_context/init script setup;
+        # with --context-uses > 1 a context serves several solves through the same proxy
+        self.context_pool = WarmContextPool(
+            prewarm_contexts, self._new_context_page, reset=self._reset_context_page,
+            policy=ReusePolicy(max_uses=context_uses, max_age=context_max_age, keep_cookies=context_keep_cookies, keep_storage=context_keep_storage), debug=debug
+        )
+        self._next_proxy = {}
+
+        # Static responses (api.js and its assets) shared by every context of this process
+        self.response_cache = ResponseCache(int(response_cache * 2**20), debug=debug)
+
+        # Parsed proxies.txt with per-proxy health; reloaded when the file changes
+        self.proxy_manager = ProxyManager(proxy_file, sticky=proxy_sticky, quarantine=proxy_quarantine, debug=debug) if proxy_support else None
+
+        # Slot states of the browser pool; dead browsers are relaunched with the same config
+        self.browser_supervisor = BrowserSupervisor(
+            self.browser_pool, self._launch_browser, self.context_pool.discard_browser,
+            recycle=RecyclePolicy(max_solves=recycle_solves, max_age=recycle_age, max_rss_mb=recycle_rss), debug=debug
+        )
+        # Real browsers or the in-process simulation, per --browser_type
+        self.backend = create_backend(browser_type, headless, sim_solve_time, sim_fail_rate, sim_crash_rate)
+        self.autoscaler = PoolAutoscaler(
+            self.browser_supervisor, self._browser_config, lambda: self.queue_depth,
+            self.min_threads, self.max_threads, budget_mb=memory_budget, browser_mb=browser_memory, debug=debug
+        )
+
+        # Token capture: page -> future resolved by the injected callbacks
+        self._token_waiters = {}
+        self._binding_supported = True
+
+        # Click strategy that won last time per (origin, sitekey)
+        self.site_profiles = SiteProfileCache(site_profiles)
+        # Serve a blank document on the target origin instead of loading the real page
+        self.origin_stub = origin_stub
+
+        # host -> base URL the browser's requests for that host are answered from (offline benchmarks)
+        self.host_map = dict(entry.split('=', 1) for entry in host_map or ())
+
+        # Stage timelines of the last finished tasks, see /traces
+        self.traces = TraceBuffer(trace_buffer)
+
+        # Prometheus metrics, updated as tasks move through the pipeline
+        self.metrics = SolverMetrics()
+        self.metrics.gauge("turnstile_browsers", "Browsers by slot state", lambda: {(state,): count for state, count in self._browser_states().items()}, ("state",))
+        self.metrics.gauge("turnstile_queued_tasks", "Tasks waiting for a free browser", lambda: {(): self.queue_depth})
+
+        # Multi-process mode: browsers live in worker processes, this one only serves the API
+        self.worker_pool = worker_pool
+        self.index_offset = 0
         
         # Initialize useragent and sec_ch_ua attributes
         self.useragent = useragent
@@ -102,6 +245,13 @@ class TurnstileAPIServer:
 
         self._setup_routes()
 
+    @property
+    def thread_count(self) -> int:
+        """Number of browsers currently in the pool."""
+        if self.worker_pool:
+            return self.worker_pool.thread_count
+        return len(self.browser_supervisor.slots) or self.min_threads
+
     def display_welcome(self):
         """Displays welcome screen with logo."""
         self.console.clear()
@@ -144,9 +294,15 @@ class TurnstileAPIServer:
     def _setup_routes(self) -> None:
         """Set up the application routes."""
         self.app.before_serving(self._startup)
+        self.app.after_serving(self._shutdown)
         self.app.route('/turnstile', methods=['GET'])(self.process_turnstile)
         self.app.route('/result', methods=['GET'])(self.get_result)
+        self.app.route('/createTasks', methods=['POST'])(self.create_tasks)
+        self.app.route('/getTaskResults', methods=['POST'])(self.get_task_results)
+        self.app.route('/stream', methods=['GET'])(self.stream_results)
         self.app.route('/health', methods=['GET'])(self.health_check)
+        self.app.route('/metrics', methods=['GET'])(self.metrics_endpoint)
+        self.app.route('/traces', methods=['GET'])(self.get_traces)
         self.app.route('/')(self.index)
         
 
@@ -155,86 +311,53 @@ class TurnstileAPIServer:
         self.display_welcome()
         logger.info("Starting browser initialization")
         try:
-            await init_db()
-            await self._initialize_browser()
+            await init_db(self.result_db, self.result_ttl)
+            if self.worker_pool:
+                self.worker_pool.start(self)
+                self._spawn(self.worker_pool.supervise())
+            else:
+                await self._initialize_browser()
             
             # Запускаем периодическую очистку старых результатов
             asyncio.create_task(self._periodic_cleanup())
+
+            if self.token_stock:
+                self._spawn(self._stock_refill_loop())
+                logger.info(f"Token stock enabled for {len(self.token_stock.targets)} sitekey tuple(s)")
             
         except Exception as e:
             logger.error(f"Failed to initialize browser: {str(e)}")
             raise
 
+    async def _shutdown(self) -> None:
+        """Stop worker processes and flush the result store on shutdown."""
+        if self.worker_pool:
+            self.worker_pool.stop()
+        await close_db()
+
     async def _initialize_browser(self) -> None:
         """Initialize the browser and create the page pool."""
-        playwright = None
-        camoufox = None
+        await self.backend.start()
 
-        if self.browser_type in ['chromium', 'chrome', 'msedge']:
-            playwright = await async_playwright().start()
-        elif self.browser_type == "camoufox":
-            camoufox = AsyncCamoufox(headless=self.headless)
+        if self.proxy_manager:
+            self.proxy_manager.load()
+            self._spawn(self.proxy_manager.run())
 
-        browser_configs = []
-        for _ in range(self.thread_count):
-            if self.browser_type in ['chromium', 'chrome', 'msedge']:
-                if self.use_random_config:
-                    browser, version, useragent, sec_ch_ua = browser_config.get_random_browser_config(self.browser_type)
-                elif self.browser_name and self.browser_version:
-                    config = browser_config.get_browser_config(self.browser_name, self.browser_version)
-                    if config:
-                        useragent, sec_ch_ua = config
-                        browser = self.browser_name
-                        version = self.browser_version
-                    else:
-                        browser, version, useragent, sec_ch_ua = browser_config.get_random_browser_config(self.browser_type)
-                else:
-                    browser = getattr(self, 'browser_name', 'custom')
-                    version = getattr(self, 'browser_version', 'custom')
-                    useragent = self.useragent
-                    sec_ch_ua = getattr(self, 'sec_ch_ua', '')
-            else:
-                # Для camoufox и других браузеров используем значения по умолчанию
-                browser = self.browser_type
-                version = 'custom'
-                useragent = self.useragent
-                sec_ch_ua = getattr(self, 'sec_ch_ua', '')
+        browser_configs = [self._browser_config() for _ in range(self.min_threads)]
 
-            
-            browser_configs.append({
-                'browser_name': browser,
-                'browser_version': version,
-                'useragent': useragent,
-                'sec_ch_ua': sec_ch_ua
-            })
-
-        for i in range(self.thread_count):
+        for i in range(self.min_threads):
             config = browser_configs[i]
-            
-            browser_args = [
-                "--window-position=0,0",
-                "--force-device-scale-factor=1"
-            ]
-            if config['useragent']:
-                browser_args.append(f"--user-agent={config['useragent']}")
-            
-            browser = None
-            if self.browser_type in ['chromium', 'chrome', 'msedge'] and playwright:
-                browser = await playwright.chromium.launch(
-                    channel=self.browser_type,
-                    headless=self.headless,
-                    args=browser_args
-                )
-            elif self.browser_type == "camoufox" and camoufox:
-                browser = await camoufox.start()
-
-            if browser:
-                await self.browser_pool.put((i+1, browser, config))
+            index = self.index_offset + i + 1
+            await self.browser_supervisor.start(index, config)
 
             if self.debug:
-                logger.info(f"Browser {i + 1} initialized successfully with {config['browser_name']} {config['browser_version']}")
+                logger.info(f"Browser {index} initialized successfully with {config['browser_name']} {config['browser_version']}")
 
-        logger.info(f"Browser pool initialized with {self.browser_pool.qsize()} browsers")
+        self._spawn(self.browser_supervisor.run())
+        logger.info(f"Browser pool initialized with {len(self.browser_supervisor.slots)} browsers")
+        if self.autoscaler.enabled:
+            self._spawn(self.autoscaler.run())
+            logger.info(f"Autoscaling between {self.min_threads} and {self.max_threads} browsers within {self.autoscaler.budget_mb:.0f}MB")
         
         if self.use_random_config:
             logger.info(f"Each browser in pool received random configuration")
@@ -250,16 +373,234 @@ class TurnstileAPIServer:
                 logger.debug(f"Browser {i+1} Sec-CH-UA: {config['sec_ch_ua']}")
 
     async def _periodic_cleanup(self):
-        """Periodic cleanup of old results every hour"""
+        """Periodically drop expired results; only due entries are touched"""
         while True:
             try:
-                await asyncio.sleep(3600)
-                deleted_count = await cleanup_old_results(days_old=7)
-                if deleted_count > 0:
-                    logger.info(f"Cleaned up {deleted_count} old results")
+                await asyncio.sleep(RESULT_EXPIRE_INTERVAL)
+                deleted_count = await cleanup_old_results()
+                if deleted_count > 0 and self.debug:
+                    logger.debug(f"Cleaned up {deleted_count} expired results")
             except Exception as e:
                 logger.error(f"Error during periodic cleanup: {e}")
 
+    def _browser_config(self) -> dict:
+        """Pick the name, version and user agent for the next browser of the pool."""
+        if self.browser_type in ['chromium', 'chrome', 'msedge']:
+            if self.use_random_config:
+                browser, version, useragent, sec_ch_ua = browser_config.get_random_browser_config(self.browser_type)
+            elif self.browser_name and self.browser_version:
+                config = browser_config.get_browser_config(self.browser_name, self.browser_version)
+                if config:
+                    useragent, sec_ch_ua = config
+                    browser = self.browser_name
+                    version = self.browser_version
+                else:
+                    browser, version, useragent, sec_ch_ua = browser_config.get_random_browser_config(self.browser_type)
+            else:
+                browser = getattr(self, 'browser_name', 'custom')
+                version = getattr(self, 'browser_version', 'custom')
+                useragent = self.useragent
+                sec_ch_ua = getattr(self, 'sec_ch_ua', '')
+        else:
+            # Для camoufox и других браузеров используем значения по умолчанию
+            browser = self.browser_type
+            version = 'custom'
+            useragent = self.useragent
+            sec_ch_ua = getattr(self, 'sec_ch_ua', '')
+
+        return {
+            'browser_name': browser,
+            'browser_version': version,
+            'useragent': useragent,
+            'sec_ch_ua': sec_ch_ua
+        }
+
+    async def _launch_browser(self, index: int, config: dict):
+        """Start one browser for a pool slot and warm its first context."""
+        browser_args = [
+            "--window-position=0,0",
+            "--force-device-scale-factor=1"
+        ]
+        if config['useragent']:
+            browser_args.append(f"--user-agent={config['useragent']}")
+
+        browser = await self.backend.launch(browser_args)
+        if browser and not self.proxy_support:
+            await self.context_pool.prewarm(index, browser, config)
+        return browser
+
+    def _try_acquire_idle_browser(self):
+        """Take a browser for background work only if no task is waiting for one.
+
+        One browser stays reserved for on-demand tasks when the pool has more than one.
+        """
+        if self.queue_depth > 0:
+            return None
+        return self.browser_supervisor.try_acquire(reserve=1 if self.thread_count > 1 else 0)
+
+    async def _stock_refill_loop(self):
+        """Keep the token stock at target using idle browsers."""
+        while True:
+            try:
+                await asyncio.sleep(STOCK_REFILL_INTERVAL)
+                for key, missing in self.token_stock.deficits():
+                    for _ in range(missing):
+                        if not self._start_stock_refill(key):
+                            break
+            except Exception as e:
+                logger.error(f"Error during token stock refill: {e}")
+
+    def _start_stock_refill(self, key) -> bool:
+        """Start solving one stock token on an idle browser, if there is one to spare."""
+        if self.worker_pool:
+            reserve = 1 if self.thread_count > 1 else 0
+            if self.queue_depth > 0 or not self.worker_pool.submit_stock(key, reserve):
+                return False
+        else:
+            slot = self._try_acquire_idle_browser()
+            if slot is None:
+                return False
+            self._spawn(self._refill_stock(key, slot))
+        self.token_stock.refill_started(key)
+        return True
+
+    async def _refill_stock(self, key, slot):
+        """Solve one stock token on an already acquired browser."""
+        index, browser, browser_config = slot
+        url, sitekey, action, cdata = key
+        try:
+            token, elapsed_time = await self._run_solve(index, browser, browser_config, url, sitekey, action, cdata)
+            if token:
+                self.token_stock.put(key, token)
+                if self.debug:
+                    logger.debug(f"Browser {index}: Stocked token for {sitekey} in {elapsed_time} Seconds")
+        except Exception as e:
+            logger.error(f"Browser {index}: Stock refill failed: {str(e)}")
+        finally:
+            self.token_stock.refill_finished(key)
+
+    def _select_proxy(self, index: int, sitekey: Optional[str] = None) -> Optional[str]:
+        """Pick a proxy line from the proxy manager."""
+        proxy = self.proxy_manager.pick(sitekey)
+        if self.debug and proxy:
+            logger.debug(f"Browser {index}: Selected proxy: {self.proxy_manager.options(proxy)['server']}")
+        elif self.debug and not proxy:
+            logger.debug(f"Browser {index}: No proxies available")
+        return proxy
+
+    def _context_options(self, index: int, browser_config: dict, proxy: Optional[str]) -> dict:
+        """Build new_context() options for a browser config and optional proxy line."""
+        context_options = {"user_agent": browser_config['useragent']}
+
+        if browser_config['sec_ch_ua'] and browser_config['sec_ch_ua'].strip():
+            context_options['extra_http_headers'] = {
+                'sec-ch-ua': browser_config['sec_ch_ua']
+            }
+
+        if not proxy:
+            if self.debug and self.proxy_support:
+                logger.debug(f"Browser {index}: Creating context without proxy")
+            return context_options
+
+        context_options["proxy"] = self.proxy_manager.options(proxy) if self.proxy_manager else parse_proxy(proxy)
+        if self.debug:
+            username = context_options["proxy"].get("username")
+            logger.debug(f"Browser {index}: Creating context with proxy {context_options['proxy']['server']}" + (f" (auth: {username}:***)" if username else ""))
+        return context_options
+
+    async def _new_context_page(self, index: int, browser, browser_config: dict, proxy: Optional[str] = None):
+        """Create a context and page with init scripts and resource blocking installed."""
+        context = await browser.new_context(**self._context_options(index, browser_config, proxy))
+
+        try:
+            if self.host_map:
+                # Registered first so the response cache still answers before it
+                await context.route(lambda request_url: urlsplit(request_url).hostname in self.host_map, self._host_map_handler)
+
+            if self.response_cache.enabled:
+                await self.response_cache.attach(context)
+
+            if self._binding_supported:
+                try:
+                    await context.expose_binding("__turnstileReport", self._on_turnstile_report)
+                except Exception as e:
+                    self._binding_supported = False
+                    logger.warning(f"Browser {index}: expose_binding unavailable, falling back to console capture and polling: {str(e)}")
+
+            page = await context.new_page()
+            page.on("console", lambda message: self._on_turnstile_console(page, message))
+
+            await self._antishadow_inject(page)
+
+            await self._block_rendering(page)
+
+            await page.add_init_script("""
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined,
+            });
+
+            window.chrome = {
+                runtime: {},
+                loadTimes: function() {},
+                csi: function() {},
+            };
+            """)
+
+            if self.browser_type in ['chromium', 'chrome', 'msedge']:
+                await page.set_viewport_size({"width": 500, "height": 100})
+                if self.debug:
+                    logger.debug(f"Browser {index}: Set viewport size to 500x240")
+        except Exception:
+            await context.close()
+            raise
+
+        return context, page
+
+    async def _reset_context_page(self, index: int, context, page, keep_cookies: bool, keep_storage: bool = False) -> None:
+        """Prepare a used context for its next solve; connections and HTTP cache survive."""
+        if not keep_storage:
+            # Every frame still shows an origin of this solve: the target site and challenges.cloudflare.com
+            await asyncio.gather(*(self._clear_frame_storage(index, frame) for frame in page.frames))
+        await page.goto("about:blank")
+        if not keep_cookies:
+            await context.clear_cookies()
+        await self._block_rendering(page)
+        if self.debug:
+            logger.debug(f"Browser {index}: Context reset for reuse")
+
+    async def _clear_frame_storage(self, index: int, frame) -> None:
+        try:
+            await frame.evaluate(CLEAR_STORAGE_SCRIPT)
+        except Exception as e:
+            if self.debug:
+                logger.debug(f"Browser {index}: Could not clear storage of {frame.url}: {str(e)}")
+
+    async def _host_map_handler(self, route):
+        """Answer a request for a mapped host from its --host-map base URL."""
+        parts = urlsplit(route.request.url)
+        target = self.host_map[parts.hostname].rstrip('/') + (parts.path or '/') + (f"?{parts.query}" if parts.query else "")
+        response = await route.fetch(url=target)
+        await route.fulfill(response=response)
+
+    def _on_turnstile_report(self, source, kind: str, value: str) -> None:
+        """Binding called from the injected widget's callback/error-callback."""
+        waiter = self._token_waiters.get(source.get('page'))
+        if waiter and not waiter.done():
+            waiter.set_result((kind, value))
+
+    def _on_turnstile_console(self, page, message) -> None:
+        """Console fallback for engines where the binding cannot be installed."""
+        waiter = self._token_waiters.get(page)
+        if not waiter or waiter.done():
+            return
+        text = message.text
+        if text.startswith('Turnstile solved with token:'):
+            token = text.split(':', 1)[1].strip()
+            if token:
+                waiter.set_result(('token', token))
+        elif text.startswith('Turnstile error:'):
+            waiter.set_result(('error', text.split(':', 1)[1].strip()))
+
     async def _antishadow_inject(self, page):
         await page.add_init_script("""
           (function() {
@@ -289,10 +630,11 @@ class TurnstileAPIServer:
             'cloudflare.com'
         ]
         
+        # fallback() lets the context-level response cache answer allowed requests
         if resource_type in allowed_types:
-            await route.continue_()
+            await route.fallback()
         elif any(domain in url for domain in allowed_domains):
-            await route.continue_() 
+            await route.fallback()
         else:
             await route.abort()
 
@@ -304,159 +646,76 @@ class TurnstileAPIServer:
         """Разблокировка рендеринга"""
         await page.unroute("**/*", self._optimized_route_handler)
 
-    async def _find_turnstile_elements(self, page, index: int):
-        """Умная проверка всех возможных Turnstile элементов"""
-        selectors = [
-            '.cf-turnstile',
-            '[data-sitekey]',
-            'iframe[src*="turnstile"]',
-            'iframe[title*="widget"]',
-            'div[id*="turnstile"]',
-            'div[class*="turnstile"]'
-        ]
-        
-        elements = []
-        for selector in selectors:
-            try:
-                # Безопасная проверка count()
-                try:
-                    count = await page.locator(selector).count()
-                except Exception:
-                    # Если count() дает ошибку, пропускаем этот селектор
-                    continue
-                    
-                if count > 0:
-                    elements.append((selector, count))
-                    if self.debug:
-                        logger.debug(f"Browser {index}: Found {count} elements with selector '{selector}'")
-            except Exception as e:
-                if self.debug:
-                    logger.debug(f"Browser {index}: Selector '{selector}' failed: {str(e)}")
-                continue
-        
-        return elements
-
-    async def _find_and_click_checkbox(self, page, index: int):
-        """Найти и кликнуть по чекбоксу Turnstile CAPTCHA внутри iframe"""
+    async def _probe_turnstile(self, page, index: int) -> dict:
+        """Snapshot every widget/iframe candidate with its bounding box in one evaluate."""
         try:
-            # Пробуем разные селекторы iframe с защитой от ошибок
-            iframe_selectors = [
-                'iframe[src*="challenges.cloudflare.com"]',
-                'iframe[src*="turnstile"]',
-                'iframe[title*="widget"]'
-            ]
-            
-            iframe_locator = None
-            for selector in iframe_selectors:
-                try:
-                    test_locator = page.locator(selector).first
-                    # Безопасная проверка count для iframe
-                    try:
-                        iframe_count = await test_locator.count()
-                    except Exception:
-                        iframe_count = 0
-                        
-                    if iframe_count > 0:
-                        iframe_locator = test_locator
-                        if self.debug:
-                            logger.debug(f"Browser {index}: Found Turnstile iframe with selector: {selector}")
-                        break
-                except Exception as e:
-                    if self.debug:
-                        logger.debug(f"Browser {index}: Iframe selector '{selector}' failed: {str(e)}")
-                    continue
-            
-            if iframe_locator:
-                try:
-                    # Получаем frame из iframe
-                    iframe_element = await iframe_locator.element_handle()
-                    frame = await iframe_element.content_frame()
-                    
-                    if frame:
-                        # Ищем чекбокс внутри iframe
-                        checkbox_selectors = [
-                            'input[type="checkbox"]',
-                            '.cb-lb input[type="checkbox"]',
-                            'label input[type="checkbox"]'
-                        ]
-                        
-                        for selector in checkbox_selectors:
-                            try:
-                                # Полностью избегаем locator.count() в iframe - используем альтернативный подход
-                                try:
-                                    # Пробуем кликнуть напрямую без count проверки
-                                    checkbox = frame.locator(selector).first
-                                    await checkbox.click(timeout=2000)
-                                    if self.debug:
-                                        logger.debug(f"Browser {index}: Successfully clicked checkbox in iframe with selector '{selector}'")
-                                    return True
-                                except Exception as click_e:
-                                    # Если прямой клик не сработал, записываем в debug но не падаем
-                                    if self.debug:
-                                        logger.debug(f"Browser {index}: Direct checkbox click failed for '{selector}': {str(click_e)}")
-                                    continue
-                            except Exception as e:
-                                if self.debug:
-                                    logger.debug(f"Browser {index}: Iframe checkbox selector '{selector}' failed: {str(e)}")
-                                continue
-                    
-                        # Если нашли iframe, но не смогли кликнуть чекбокс, пробуем клик по iframe
-                        try:
-                            if self.debug:
-                                logger.debug(f"Browser {index}: Trying to click iframe directly as fallback")
-                            await iframe_locator.click(timeout=1000)
-                            return True
-                        except Exception as e:
-                            if self.debug:
-                                logger.debug(f"Browser {index}: Iframe direct click failed: {str(e)}")
-                
-                except Exception as e:
-                    if self.debug:
-                        logger.debug(f"Browser {index}: Failed to access iframe content: {str(e)}")
-            
+            snapshot = await page.evaluate(TURNSTILE_PROBE_SCRIPT)
         except Exception as e:
             if self.debug:
-                logger.debug(f"Browser {index}: General iframe search failed: {str(e)}")
-        
-        return False
-
-    async def _try_click_strategies(self, page, index: int):
-        strategies = [
-            ('checkbox_click', lambda: self._find_and_click_checkbox(page, index)),
-            ('direct_widget', lambda: self._safe_click(page, '.cf-turnstile', index)),
-            ('iframe_click', lambda: self._safe_click(page, 'iframe[src*="turnstile"]', index)),
-            ('js_click', lambda: page.evaluate("document.querySelector('.cf-turnstile')?.click()")),
-            ('sitekey_attr', lambda: self._safe_click(page, '[data-sitekey]', index)),
-            ('any_turnstile', lambda: self._safe_click(page, '*[class*="turnstile"]', index)),
-            ('xpath_click', lambda: self._safe_click(page, "//div[@class='cf-turnstile']", index))
-        ]
-        
-        for strategy_name, strategy_func in strategies:
+                logger.debug(f"Browser {index}: Turnstile probe failed: {str(e)}")
+            snapshot = None
+        return snapshot or {"widgets": {}, "iframes": []}
+
+    async def _find_turnstile_elements(self, page, index: int, snapshot: Optional[dict] = None):
+        """Умная проверка всех возможных Turnstile элементов"""
+        if snapshot is None:
+            snapshot = await self._probe_turnstile(page, index)
+
+        elements = [(selector, len(boxes)) for selector, boxes in snapshot["widgets"].items() if boxes]
+        if snapshot["iframes"]:
+            elements.append(('iframe', len(snapshot["iframes"])))
+        if self.debug:
+            for selector, count in elements:
+                logger.debug(f"Browser {index}: Found {count} elements with selector '{selector}'")
+        return elements
+
+    @staticmethod
+    def _click_candidates(snapshot: dict):
+        """Ordered (strategy, x, y) click points derived from a probe snapshot."""
+        candidates = []
+        for rect in snapshot["iframes"][:1]:
+            # The checkbox sits at the left edge of the widget iframe
+            candidates.append(('checkbox_click', rect["x"] + min(30, rect["width"] / 2), rect["y"] + rect["height"] / 2))
+            candidates.append(('iframe_click', rect["x"] + rect["width"] / 2, rect["y"] + rect["height"] / 2))
+        for strategy, selector in (('direct_widget', '.cf-turnstile'), ('sitekey_attr', '[data-sitekey]'), ('any_turnstile', '*[class*="turnstile"]')):
+            for rect in snapshot["widgets"].get(selector, [])[:1]:
+                candidates.append((strategy, rect["x"] + rect["width"] / 2, rect["y"] + rect["height"] / 2))
+        return candidates
+
+    async def _try_click_strategies(self, page, index: int, click_number: int = 0, preferred: Optional[str] = None) -> Optional[str]:
+        """Click one Turnstile candidate from a fresh probe snapshot.
+
+        Successive calls rotate through the candidates, starting with the
+        ``preferred`` strategy learned for the site. Returns the strategy used.
+        """
+        snapshot = await self._probe_turnstile(page, index)
+        candidates = self._click_candidates(snapshot)
+        if preferred:
+            candidates.sort(key=lambda candidate: candidate[0] != preferred)
+
+        if self.debug:
+            await self._find_turnstile_elements(page, index, snapshot)
+
+        if not candidates:
+            # Nothing visible yet: a JS click costs the same single round-trip
             try:
-                result = await strategy_func()
-                if result is True or result is None:  # None означает успех для большинства стратегий
-                    if self.debug:
-                        logger.debug(f"Browser {index}: Click strategy '{strategy_name}' succeeded")
-                    return True
+                await page.evaluate("document.querySelector('.cf-turnstile')?.click()")
+                return 'js_click'
             except Exception as e:
                 if self.debug:
-                    logger.debug(f"Browser {index}: Click strategy '{strategy_name}' failed: {str(e)}")
-                continue
-        
-        return False
+                    logger.debug(f"Browser {index}: Click strategy 'js_click' failed: {str(e)}")
+                return None
 
-    async def _safe_click(self, page, selector: str, index: int):
-        """Полностью безопасный клик с максимальной защитой от ошибок"""
+        strategy, x, y = candidates[click_number % len(candidates)]
         try:
-            # Пробуем кликнуть напрямую без count() проверки
-            locator = page.locator(selector).first
-            await locator.click(timeout=1000)
-            return True
+            await page.mouse.click(x, y)
+            if self.debug:
+                logger.debug(f"Browser {index}: Click strategy '{strategy}' clicked at ({round(x)}, {round(y)})")
+            return strategy
         except Exception as e:
-            # Логируем ошибку только в debug режиме
-            if self.debug and "Can't query n-th element" not in str(e):
-                logger.debug(f"Browser {index}: Safe click failed for '{selector}': {str(e)}")
-            return False
+            if self.debug:
+                logger.debug(f"Browser {index}: Click strategy '{strategy}' failed: {str(e)}")
+            return None
 
     async def _inject_captcha_directly(self, page, websiteKey: str, action: str = '', cdata: str = '', index: int = 0):
         """Inject CAPTCHA directly into the target website"""
@@ -465,11 +724,22 @@ class TurnstileAPIServer:
         document.querySelectorAll('.cf-turnstile').forEach(el => el.remove());
         document.querySelectorAll('[data-sitekey]').forEach(el => el.remove());
         
+        // Callbacks of the implicitly rendered widget (api.js renders .cf-turnstile on load)
+        window.onTurnstileCallback = function(token) {{
+            console.log('Turnstile solved with token:', token);
+            if (window.__turnstileReport) window.__turnstileReport('token', token);
+        }};
+        window.onTurnstileError = function(error) {{
+            console.log('Turnstile error:', error);
+            if (window.__turnstileReport) window.__turnstileReport('error', String(error));
+        }};
+        
         // Create turnstile widget directly on the page
         const captchaDiv = document.createElement('div');
         captchaDiv.className = 'cf-turnstile';
         captchaDiv.setAttribute('data-sitekey', '{websiteKey}');
         captchaDiv.setAttribute('data-callback', 'onTurnstileCallback');
+        captchaDiv.setAttribute('data-error-callback', 'onTurnstileError');
         {f'captchaDiv.setAttribute("data-action", "{action}");' if action else ''}
         {f'captchaDiv.setAttribute("data-cdata", "{cdata}");' if cdata else ''}
         captchaDiv.style.position = 'fixed';
@@ -503,6 +773,8 @@ class TurnstileAPIServer:
                                 {f'cdata: "{cdata}",' if cdata else ''}
                                 callback: function(token) {{
                                     console.log('Turnstile solved with token:', token);
+                                    // Push the token straight to Python
+                                    if (window.__turnstileReport) window.__turnstileReport('token', token);
                                     // Create hidden input for token
                                     let tokenInput = document.querySelector('input[name="cf-turnstile-response"]');
                                     if (!tokenInput) {{
@@ -515,6 +787,7 @@ class TurnstileAPIServer:
                                 }},
                                 'error-callback': function(error) {{
                                     console.log('Turnstile error:', error);
+                                    if (window.__turnstileReport) window.__turnstileReport('error', String(error));
                                 }}
                             }});
                         }} catch (e) {{
@@ -541,6 +814,7 @@ class TurnstileAPIServer:
                     {f'cdata: "{cdata}",' if cdata else ''}
                     callback: function(token) {{
                         console.log('Turnstile solved with token:', token);
+                        if (window.__turnstileReport) window.__turnstileReport('token', token);
                         let tokenInput = document.querySelector('input[name="cf-turnstile-response"]');
                         if (!tokenInput) {{
                             tokenInput = document.createElement('input');
@@ -552,6 +826,7 @@ class TurnstileAPIServer:
                     }},
                     'error-callback': function(error) {{
                         console.log('Turnstile error:', error);
+                        if (window.__turnstileReport) window.__turnstileReport('error', String(error));
                     }}
                 }});
             }} catch (e) {{
@@ -561,290 +836,415 @@ class TurnstileAPIServer:
         }} else {{
             loadTurnstile();
         }}
-        
-        // Setup global callback
-        window.onTurnstileCallback = function(token) {{
-            console.log('Global turnstile callback executed:', token);
-        }};
         """
 
         await page.evaluate(script)
         if self.debug:
             logger.debug(f"Browser {index}: Injected CAPTCHA directly into website with sitekey: {websiteKey}")
 
-    async def _solve_turnstile(self, task_id: str, url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None):
-        """Solve the Turnstile challenge."""
-        proxy = None
+    async def _solve_turnstile(self, task_id: str, record: TaskRecord):
+        """Wait for a free browser, then solve the Turnstile challenge for a task."""
+        enqueued_at = time.time()
+        trace = TaskTrace(enqueued_at)
+        try:
+            index, browser, browser_config = await asyncio.wait_for(self.browser_supervisor.acquire(), timeout=self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            queue_wait = round(time.time() - enqueued_at, 3)
+            self.autoscaler.observe_wait(queue_wait)
+            self.metrics.queue_wait.observe(queue_wait)
+            logger.warning(f"Task {task_id}: No browser available after {queue_wait} Seconds in queue")
+            trace.mark("failed")
+            trace.result = "no_slot"
+            await self._finish_task(task_id, None, queue_wait, "ERROR_NO_SLOT_AVAILABLE", record, trace.to_dict())
+            return
+        finally:
+            self.queue_depth -= 1
+
+        trace.mark("acquired")
+        self.autoscaler.observe_wait(time.time() - enqueued_at)
+        self.metrics.queue_wait.observe(time.time() - enqueued_at)
+        if self.debug:
+            logger.debug(f"Browser {index}: Acquired for task {task_id} after {round(time.time() - enqueued_at, 3)} Seconds in queue")
 
-        index, browser, browser_config = await self.browser_pool.get()
-        
         try:
-            if hasattr(browser, 'is_connected') and not browser.is_connected():
-                if self.debug:
-                    logger.warning(f"Browser {index}: Browser disconnected, skipping")
-                await self.browser_pool.put((index, browser, browser_config))
-                await save_result(task_id, "turnstile", {"value": "CAPTCHA_FAIL", "elapsed_time": 0})
-                return
+            token, elapsed_time = await self._run_solve(index, browser, browser_config, record.url, record.sitekey, record.action, record.cdata, trace)
         except Exception as e:
+            logger.error(f"Browser {index}: Unexpected error solving task {task_id}: {str(e)}")
+            self.metrics.failure("error")
+            token, elapsed_time = None, round(time.time() - enqueued_at, 3)
+        await self._finish_task(task_id, token, elapsed_time, record=record, trace=trace.to_dict())
+
+    async def _solve_on_page(self, index: int, browser, page, url: str, sitekey: str, action: Optional[str], cdata: Optional[str], trace: TaskTrace, profile_key, preferred_strategy: Optional[str], stub: bool = False):
+        """Open the target origin, inject the widget and wait for its token.
+
+        ``preferred_strategy`` is the click strategy remembered for ``profile_key``.
+        A stub try gets a shorter budget so a failing stub falls back quickly,
+        and the wait ends at once if the browser or page goes away.
+        Returns ``(token, None)`` or ``(None, failure cause)``.
+        """
+        navigation_start = time.time()
+        trace.mode = "stub" if stub else "navigate"
+        if stub:
             if self.debug:
-                logger.warning(f"Browser {index}: Cannot check browser state: {str(e)}")
+                logger.debug(f"Browser {index}: Serving origin stub for: {url}")
+            await self._goto_origin_stub(page, url)
+        else:
+            if self.debug:
+                logger.debug(f"Browser {index}: Loading real website directly: {url}")
+            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+        self.metrics.navigation.observe(time.time() - navigation_start, trace.mode)
+        trace.mark("navigated")
 
-        if self.proxy_support:
-            proxy_file_path = os.path.join(os.getcwd(), "proxies.txt")
+        await self._unblock_rendering(page)
 
+        # Сразу инъектируем виджет Turnstile на целевой сайт
+        if self.debug:
+            logger.debug(f"Browser {index}: Injecting Turnstile widget directly into target site")
+
+        waiter = self._token_waiters[page] = asyncio.get_running_loop().create_future()
+        await self._inject_captcha_directly(page, sitekey, action or '', cdata or '', index)
+        injected_at = time.time()
+        trace.mark("injected")
+
+        max_attempts = ORIGIN_STUB_ATTEMPTS if stub else SOLVE_ATTEMPTS
+        click_count = 0
+        max_clicks = 10
+        last_strategy = None
+        # Sites with a known winning strategy get their first click right after rendering
+        first_click_attempt = 1 if preferred_strategy else 3
+
+        for attempt in range(max_attempts):
+            trace.attempts += 1
+            # The first wait gives the widget time to load and render
+            wait_time = 3 if attempt == 0 else min(0.5 + (attempt * 0.05), 2.0)
             try:
-                with open(proxy_file_path) as proxy_file:
-                    proxies = [line.strip() for line in proxy_file if line.strip()]
-
-                proxy = random.choice(proxies) if proxies else None
-                
-                if self.debug and proxy:
-                    logger.debug(f"Browser {index}: Selected proxy: {proxy}")
-                elif self.debug and not proxy:
-                    logger.debug(f"Browser {index}: No proxies available")
-                    
-            except FileNotFoundError:
-                logger.warning(f"Proxy file not found: {proxy_file_path}")
-                proxy = None
-            except Exception as e:
-                logger.error(f"Error reading proxy file: {str(e)}")
-                proxy = None
+                kind, value = await asyncio.wait_for(asyncio.shield(waiter), timeout=wait_time)
+            except asyncio.TimeoutError:
+                kind, value = None, None
 
-            if proxy:
-                if '@' in proxy:
-                    try:
-                        scheme_part, auth_part = proxy.split('://')
-                        auth, address = auth_part.split('@')
-                        username, password = auth.split(':')
-                        ip, port = address.split(':')
-                        if self.debug:
-                            logger.debug(f"Browser {index}: Creating context with proxy {scheme_part}://{ip}:{port} (auth: {username}:***)")
-                        context_options = {
-                            "proxy": {
-                                "server": f"{scheme_part}://{ip}:{port}",
-                                "username": username,
-                                "password": password
-                            },
-                            "user_agent": browser_config['useragent']
-                        }
-                        
-                        if browser_config['sec_ch_ua'] and browser_config['sec_ch_ua'].strip():
-                            context_options['extra_http_headers'] = {
-                                'sec-ch-ua': browser_config['sec_ch_ua']
-                            }
-                        
-                        context = await browser.new_context(**context_options)
-                    except ValueError:
-                        raise ValueError(f"Invalid proxy format: {proxy}")
-                else:
-                    parts = proxy.split(':')
-                    if len(parts) == 5:
-                        proxy_scheme, proxy_ip, proxy_port, proxy_user, proxy_pass = parts
-                        if self.debug:
-                            logger.debug(f"Browser {index}: Creating context with proxy {proxy_scheme}://{proxy_ip}:{proxy_port} (auth: {proxy_user}:***)")
-                        context_options = {
-                            "proxy": {
-                                "server": f"{proxy_scheme}://{proxy_ip}:{proxy_port}",
-                                "username": proxy_user,
-                                "password": proxy_pass
-                            },
-                            "user_agent": browser_config['useragent']
-                        }
-                        
-                        if browser_config['sec_ch_ua'] and browser_config['sec_ch_ua'].strip():
-                            context_options['extra_http_headers'] = {
-                                'sec-ch-ua': browser_config['sec_ch_ua']
-                            }
-                        
-                        context = await browser.new_context(**context_options)
-                    elif len(parts) == 3:
-                        if self.debug:
-                            logger.debug(f"Browser {index}: Creating context with proxy {proxy}")
-                        context_options = {
-                            "proxy": {"server": f"{proxy}"},
-                            "user_agent": browser_config['useragent']
-                        }
-                        
-                        if browser_config['sec_ch_ua'] and browser_config['sec_ch_ua'].strip():
-                            context_options['extra_http_headers'] = {
-                                'sec-ch-ua': browser_config['sec_ch_ua']
-                            }
-                        
-                        context = await browser.new_context(**context_options)
-                    else:
-                        raise ValueError(f"Invalid proxy format: {proxy}")
-            else:
+            try:
+                if kind is None:
+                    # Safety net for widgets whose callback never reached the binding: read all token inputs in one round-trip
+                    value = await page.evaluate(TOKEN_INPUT_SCRIPT)
+                    kind = 'token' if value else None
+
+                if kind == 'token':
+                    if last_strategy:
+                        self.site_profiles.record(profile_key, last_strategy)
+                    self.metrics.token_wait.observe(time.time() - injected_at)
+                    return value, None
+
+                if kind == 'error':
+                    if self.debug:
+                        logger.error(f"Browser {index}: Turnstile reported error {value}")
+                    return None, "turnstile_error"
+
+                if attempt >= first_click_attempt and (attempt - first_click_attempt) % 3 == 0 and click_count < max_clicks:
+                    clicked_strategy = await self._try_click_strategies(page, index, click_count, preferred_strategy)
+                    last_strategy = clicked_strategy or last_strategy
+                    click_count += 1
+                    self.metrics.clicks.inc(clicked_strategy or "none")
+                    trace.click(clicked_strategy)
+                    if clicked_strategy and self.debug:
+                        logger.debug(f"Browser {index}: Click successful (click #{click_count}/{max_clicks})")
+                    elif not clicked_strategy and self.debug:
+                        logger.debug(f"Browser {index}: All click strategies failed on attempt {attempt + 1} (click #{click_count}/{max_clicks})")
+
+                if self.debug and attempt % 5 == 0:
+                    logger.debug(f"Browser {index}: Attempt {attempt + 1}/{max_attempts} - Waiting for token (clicks: {click_count}/{max_clicks})")
+
+            except Exception as e:
                 if self.debug:
-                    logger.debug(f"Browser {index}: Creating context without proxy")
-                context_options = {"user_agent": browser_config['useragent']}
-                
-                if browser_config['sec_ch_ua'] and browser_config['sec_ch_ua'].strip():
-                    context_options['extra_http_headers'] = {
-                        'sec-ch-ua': browser_config['sec_ch_ua']
-                    }
-                
-                context = await browser.new_context(**context_options)
-        else:
-            context_options = {"user_agent": browser_config['useragent']}
-            
-            if browser_config['sec_ch_ua'] and browser_config['sec_ch_ua'].strip():
-                context_options['extra_http_headers'] = {
-                    'sec-ch-ua': browser_config['sec_ch_ua']
-                }
-            
-            context = await browser.new_context(**context_options)
+                    logger.debug(f"Browser {index}: Attempt {attempt + 1} error: {str(e)}")
+                if page.is_closed() or (hasattr(browser, 'is_connected') and not browser.is_connected()):
+                    return None, "browser_disconnected"
+                continue
 
-        page = await context.new_page()
-        
-        await self._antishadow_inject(page)
-        
-        await self._block_rendering(page)
-        
-        await page.add_init_script("""
-        Object.defineProperty(navigator, 'webdriver', {
-            get: () => undefined,
-        });
-        
-        window.chrome = {
-            runtime: {},
-            loadTimes: function() {},
-            csi: function() {},
-        };
-        """)
-        
-        if self.browser_type in ['chromium', 'chrome', 'msedge']:
-            await page.set_viewport_size({"width": 500, "height": 100})
-            if self.debug:
-                logger.debug(f"Browser {index}: Set viewport size to 500x240")
+        return None, "timeout"
 
-        start_time = time.time()
+    async def _goto_origin_stub(self, page, url: str) -> None:
+        """Navigate to ``url`` with the main document answered locally instead of by the site."""
+        async def serve_stub(route):
+            request = route.request
+            if request.is_navigation_request() and request.frame == page.main_frame:
+                await route.fulfill(status=200, content_type='text/html', body=ORIGIN_STUB_HTML)
+            else:
+                await route.fallback()
 
+        await page.route("**/*", serve_stub)
         try:
-            if self.debug:
-                logger.debug(f"Browser {index}: Starting Turnstile solve for URL: {url} with Sitekey: {sitekey} | Action: {action} | Cdata: {cdata} | Proxy: {proxy}")
-                logger.debug(f"Browser {index}: Setting up optimized page loading with resource blocking")
+            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+        finally:
+            await page.unroute("**/*", serve_stub)
+
+    async def _run_solve(self, index: int, browser, browser_config: dict, url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None, trace: Optional[TaskTrace] = None):
+        """Solve one challenge on an acquired browser and return it to the pool.
 
+        Returns a ``(token, elapsed_time)`` tuple, token is None on failure.
+        Stage timings are recorded in ``trace``.
+        """
+        acquired_at = time.time()
+        trace = trace or TaskTrace(acquired_at)
+        trace.browser = index
+
+        try:
+            if hasattr(browser, 'is_connected') and not browser.is_connected():
+                if self.debug:
+                    logger.warning(f"Browser {index}: Browser disconnected, skipping")
+                self.browser_supervisor.release(index, browser, solved=False)
+                self.metrics.failure("browser_disconnected")
+                trace.mark("failed")
+                trace.result = "browser_disconnected"
+                return None, 0
+        except Exception as e:
             if self.debug:
-                logger.debug(f"Browser {index}: Loading real website directly: {url}")
+                logger.warning(f"Browser {index}: Cannot check browser state: {str(e)}")
 
-            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+        # The proxy was picked when the previous task released this browser, so its context is warm.
+        # Sticky assignment overrides it when this sitekey is bound to another proxy.
+        proxy = self._next_proxy.pop(index, None)
+        if self.proxy_manager and (not proxy or self.proxy_manager.sticky):
+            proxy = self._select_proxy(index, sitekey)
+        if proxy:
+            trace.proxy = self.proxy_manager.options(proxy)["server"] if self.proxy_manager else proxy
+        context = page = None
+        start_time = time.time()
+        token = None
+        cause = "error"
 
-            await self._unblock_rendering(page)
+        try:
+            context, page, warm = await self.context_pool.checkout(index, browser, browser_config, proxy)
+            self.metrics.context_setup.observe(time.time() - start_time, "true" if warm else "false")
+            trace.mark("context_ready")
+            start_time = time.time()
 
-            # Сразу инъектируем виджет Turnstile на целевой сайт
             if self.debug:
-                logger.debug(f"Browser {index}: Injecting Turnstile widget directly into target site")
-            
-            await self._inject_captcha_directly(page, sitekey, action or '', cdata or '', index)
-            
-            # Ждем время для загрузки и рендеринга виджета
-            await asyncio.sleep(3)
-
-            locator = page.locator('input[name="cf-turnstile-response"]')
-            max_attempts = 30
-            click_count = 0
-            max_clicks = 10
+                logger.debug(f"Browser {index}: Starting Turnstile solve for URL: {url} with Sitekey: {sitekey} | Action: {action} | Cdata: {cdata} | Proxy: {proxy}")
+                logger.debug(f"Browser {index}: Setting up optimized page loading with resource blocking")
 
-            for attempt in range(max_attempts):
+            profile_key = self.site_profiles.key(url, sitekey)
+            # Looked up once per task so a stub fallback does not count twice
+            preferred_strategy = self.site_profiles.preferred(profile_key)
+            if self.origin_stub and self.site_profiles.use_stub(profile_key):
                 try:
-                    # Безопасная проверка количества элементов с токеном
-                    try:
-                        count = await locator.count()
-                    except Exception as e:
-                        if self.debug:
-                            logger.debug(f"Browser {index}: Locator count failed on attempt {attempt + 1}: {str(e)}")
-                        count = 0
-
-                    if count == 0:
-                        if self.debug and attempt % 5 == 0:
-                            logger.debug(f"Browser {index}: No token elements found on attempt {attempt + 1}")
-                    elif count == 1:
-                        # Если только один элемент, проверяем его токен
-                        try:
-                            token = await locator.input_value(timeout=500)
-                            if token:
-                                elapsed_time = round(time.time() - start_time, 3)
-                                logger.success(f"Browser {index}: Successfully solved captcha - {COLORS.get('MAGENTA')}{token[:10]}{COLORS.get('RESET')} in {COLORS.get('GREEN')}{elapsed_time}{COLORS.get('RESET')} Seconds")
-                                await save_result(task_id, "turnstile", {"value": token, "elapsed_time": elapsed_time})
-                                return
-                        except Exception as e:
-                            if self.debug:
-                                logger.debug(f"Browser {index}: Single token element check failed: {str(e)}")
-                    else:
-                        # Если несколько элементов, проверяем все по очереди
-                        if self.debug:
-                            logger.debug(f"Browser {index}: Found {count} token elements, checking all")
-
-                        for i in range(count):
-                            try:
-                                element_token = await locator.nth(i).input_value(timeout=500)
-                                if element_token:
-                                    elapsed_time = round(time.time() - start_time, 3)
-                                    logger.success(f"Browser {index}: Successfully solved captcha - {COLORS.get('MAGENTA')}{element_token[:10]}{COLORS.get('RESET')} in {COLORS.get('GREEN')}{elapsed_time}{COLORS.get('RESET')} Seconds")
-                                    await save_result(task_id, "turnstile", {"value": element_token, "elapsed_time": elapsed_time})
-                                    return
-                            except Exception as e:
-                                if self.debug:
-                                    logger.debug(f"Browser {index}: Token element {i} check failed: {str(e)}")
-                                continue
-
-                    if attempt > 2 and attempt % 3 == 0 and click_count < max_clicks:
-                        click_success = await self._try_click_strategies(page, index)
-                        click_count += 1
-                        if click_success and self.debug:
-                            logger.debug(f"Browser {index}: Click successful (click #{click_count}/{max_clicks})")
-                        elif not click_success and self.debug:
-                            logger.debug(f"Browser {index}: All click strategies failed on attempt {attempt + 1} (click #{click_count}/{max_clicks})")
-
-                    # Адаптивное ожидание
-                    wait_time = min(0.5 + (attempt * 0.05), 2.0)
-                    await asyncio.sleep(wait_time)
-
-                    if self.debug and attempt % 5 == 0:
-                        logger.debug(f"Browser {index}: Attempt {attempt + 1}/{max_attempts} - Waiting for token (clicks: {click_count}/{max_clicks})")
-
+                    token, cause = await self._solve_on_page(index, browser, page, url, sitekey, action, cdata, trace, profile_key, preferred_strategy, stub=True)
                 except Exception as e:
                     if self.debug:
-                        logger.debug(f"Browser {index}: Attempt {attempt + 1} error: {str(e)}")
-                    continue
-            
+                        logger.debug(f"Browser {index}: Origin stub solve error: {str(e)}")
+                # Only a widget that failed on the loaded stub counts against it, not proxy, navigation or browser errors
+                if token is not None or cause in ("turnstile_error", "timeout"):
+                    self.site_profiles.record_stub(profile_key, token is not None)
+                if token is None and cause != "browser_disconnected":
+                    logger.warning(f"Browser {index}: Origin stub failed for {profile_key[0]}, falling back to real navigation")
+                    trace.mark("fallback")
+                    await self._block_rendering(page)
+
+            if token is None and cause != "browser_disconnected":
+                token, cause = await self._solve_on_page(index, browser, page, url, sitekey, action, cdata, trace, profile_key, preferred_strategy)
+
             elapsed_time = round(time.time() - start_time, 3)
-            await save_result(task_id, "turnstile", {"value": "CAPTCHA_FAIL", "elapsed_time": elapsed_time})
-            if self.debug:
+            if token:
+                logger.success(f"Browser {index}: Successfully solved captcha - {COLORS.get('MAGENTA')}{token[:10]}{COLORS.get('RESET')} in {COLORS.get('GREEN')}{elapsed_time}{COLORS.get('RESET')} Seconds")
+            elif self.debug:
                 logger.error(f"Browser {index}: Error solving Turnstile in {COLORS.get('RED')}{elapsed_time}{COLORS.get('RESET')} Seconds")
+            return token, elapsed_time
         except Exception as e:
             elapsed_time = round(time.time() - start_time, 3)
-            await save_result(task_id, "turnstile", {"value": "CAPTCHA_FAIL", "elapsed_time": elapsed_time})
+            if hasattr(browser, 'is_connected') and not browser.is_connected():
+                cause = "browser_disconnected"
             if self.debug:
                 logger.error(f"Browser {index}: Error solving Turnstile: {str(e)}")
+            return None, elapsed_time
         finally:
+            self._token_waiters.pop(page, None)
+            self._observe_solve_time(time.time() - acquired_at)
+            self.metrics.solve.observe(time.time() - start_time, "success" if token else "failure")
+            trace.mark("token" if token else "failed")
+            trace.result = "success" if token else cause
+            if token:
+                self.metrics.solves.inc("success")
+            else:
+                self.metrics.solves.inc("failure")
+                self.metrics.failure(cause, proxy)
+            if self.proxy_manager:
+                self.proxy_manager.report(proxy, token is not None, time.time() - start_time)
+
             if self.debug:
-                logger.debug(f"Browser {index}: Closing browser context and cleaning up")
-            
-            try:
-                await context.close()
-                if self.debug:
-                    logger.debug(f"Browser {index}: Context closed successfully")
-            except Exception as e:
-                if self.debug:
-                    logger.warning(f"Browser {index}: Error closing context: {str(e)}")
-            
+                logger.debug(f"Browser {index}: Releasing browser context, replacement is prepared in background")
+
+            next_proxy = None
+            if self.proxy_manager:
+                # Sticky mode warms the proxy of this sitekey, most likely asked for again
+                next_proxy = self._next_proxy[index] = self._select_proxy(index, sitekey)
+            self.context_pool.release(index, browser, browser_config, next_proxy, context, page, used_proxy=proxy, reusable=token is not None)
+
+            # A browser that died meanwhile is relaunched by the supervisor instead
+            self.browser_supervisor.release(index, browser)
+            if self.debug:
+                logger.debug(f"Browser {index}: Browser returned to pool")
+
+
+
+
+
+
+    async def _save_result(self, task_id: str, record: TaskRecord) -> None:
+        """Persist a task record and wake up any requests long-polling for it."""
+        await save_result(task_id, "turnstile", record)
+        if record.is_final:
+            waiter = self._result_waiters.pop(task_id, None)
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+            self._publish_result(task_id, record)
+
+    async def _finish_task(self, task_id: str, token: Optional[str], elapsed_time: float, error_code: Optional[str] = None, record: Optional[TaskRecord] = None, trace: Optional[dict] = None) -> None:
+        """Record the outcome of a task, failed when token is None."""
+        record = record or await load_result(task_id) or TaskRecord()
+        record.finish(token, elapsed_time, error_code)
+        if trace:
+            record.trace = trace
+            self.traces.append(trace)
+        if error_code == "ERROR_NO_SLOT_AVAILABLE":
+            self.metrics.failure("no_slot")
+        await self._save_result(task_id, record)
+
+    @staticmethod
+    def _result_event(task_id: str, record: TaskRecord) -> dict:
+        """Build the streamed representation of a finished task."""
+        if record.status is TaskStatus.READY:
+            return {"taskId": task_id, "status": "ready", "token": record.token, "elapsed_time": record.elapsed_time}
+        return {
+            "taskId": task_id,
+            "status": "failed",
+            "errorCode": record.error_code or "ERROR_CAPTCHA_UNSOLVABLE",
+            "elapsed_time": record.elapsed_time
+        }
+
+    def _publish_result(self, task_id: str, record: TaskRecord) -> None:
+        """Push a finished task to every matching /stream subscriber."""
+        if not self._subscribers:
+            return
+        event = self._result_event(task_id, record)
+        for queue, task_ids in list(self._subscribers.items()):
+            if task_ids is not None and task_id not in task_ids:
+                continue
             try:
-                if hasattr(browser, 'is_connected') and browser.is_connected():
-                    await self.browser_pool.put((index, browser, browser_config))
-                    if self.debug:
-                        logger.debug(f"Browser {index}: Browser returned to pool")
-                else:
-                    if self.debug:
-                        logger.warning(f"Browser {index}: Browser disconnected, not returning to pool")
-            except Exception as e:
-                if self.debug:
-                    logger.warning(f"Browser {index}: Error returning browser to pool: {str(e)}")
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Stream subscriber is too slow, dropped result for task {task_id}")
+
+    async def _wait_for_result(self, task_id: str, timeout: float) -> None:
+        """Park the caller until the task finishes or the timeout expires."""
+        waiter = self._result_waiters.get(task_id)
+        if waiter is None or timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _observe_solve_time(self, elapsed: float) -> None:
+        """Track a moving average of browser occupancy per task for Retry-After hints."""
+        self._avg_solve_time = 0.8 * self._avg_solve_time + 0.2 * elapsed
+
+    def _retry_after(self) -> int:
+        """Estimate seconds until the queue drains enough to admit a new task."""
+        estimate = math.ceil(self._avg_solve_time * (self.queue_depth + 1) / max(self.thread_count, 1))
+        return max(1, min(estimate, int(self.queue_timeout or 60)))
+
+    def _queue_full_response(self):
+        """Fast rejection used when the admission queue is at capacity."""
+        retry_after = self._retry_after()
+        return jsonify({
+            "errorId": 1,
+            "errorCode": "ERROR_NO_SLOT_AVAILABLE",
+            "errorDescription": "Task queue is full, retry later",
+            "queueDepth": self.queue_depth,
+            "retryAfter": retry_after
+        }), 429, {"Retry-After": str(retry_after)}
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """Start a background task and keep a reference until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def _queue_full(self) -> bool:
+        """Whether the admission queue has reached --max-queue."""
+        return bool(self.max_queue) and self.queue_depth >= self.max_queue
+
+    async def _create_task(self, url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None) -> Optional[str]:
+        """Register a new task and schedule it for solving.
+
+        Stocked tokens are served immediately. Returns None when the task is
+        rejected because the admission queue is full.
+        """
+        token = self.token_stock.take(url, sitekey, action, cdata) if self.token_stock else None
+        if token is None and self._queue_full():
+            return None
+
+        task_id = str(uuid.uuid4())
+        record = TaskRecord.pending(url, sitekey, action, cdata)
+        if token:
+            if self.debug:
+                logger.debug(f"Task {task_id}: Served from token stock")
+            self.metrics.stock_hits.inc()
+            await self._finish_task(task_id, token, 0, record=record)
+            return task_id
+
+        self._result_waiters[task_id] = asyncio.get_running_loop().create_future()
+        await save_result(task_id, "turnstile", record)
+
+        self.queue_depth += 1
+        if self.worker_pool:
+            self.worker_pool.submit(task_id, record)
+        else:
+            self._spawn(self._solve_turnstile(task_id, record))
+        return task_id
+
+    @staticmethod
+    def _format_result(result: Optional[TaskRecord]) -> dict:
+        """Convert a stored task record into the /result response body."""
+        if result is None:
+            return {
+                "errorId": 1,
+                "errorCode": "ERROR_CAPTCHA_UNSOLVABLE",
+                "errorDescription": "Task not found"
+            }
 
+        if result.status is TaskStatus.PENDING:
+            return {"status": "processing"}
 
+        if result.error_code == "ERROR_NO_SLOT_AVAILABLE":
+            return {
+                "errorId": 1,
+                "errorCode": "ERROR_NO_SLOT_AVAILABLE",
+                "errorDescription": "No browser became available within the queue timeout"
+            }
 
+        if result.status is TaskStatus.READY:
+            return {
+                "errorId": 0,
+                "status": "ready",
+                "solution": {
+                    "token": result.token
+                }
+            }
 
+        return {
+            "errorId": 1,
+            "errorCode": "ERROR_CAPTCHA_UNSOLVABLE",
+            "errorDescription": "Workers could not solve the Captcha"
+        }
 
+    @staticmethod
+    def _parse_wait(value) -> float:
+        """Clamp a client supplied long-poll duration to [0, MAX_RESULT_WAIT]."""
+        try:
+            return min(max(float(value or 0), 0), MAX_RESULT_WAIT)
+        except (TypeError, ValueError):
+            return 0
 
     async def process_turnstile(self):
         """Handle the /turnstile endpoint requests."""
@@ -868,18 +1268,12 @@ class TurnstileAPIServer:
                 "errorDescription": "Both 'url' and 'sitekey' are required"
             }), 200
 
-        task_id = str(uuid.uuid4())
-        await save_result(task_id, "turnstile", {
-            "status": "CAPTCHA_NOT_READY",
-            "createTime": int(time.time()),
-            "url": url,
-            "sitekey": sitekey,
-            "action": action,
-            "cdata": cdata
-        })
-
         try:
-            asyncio.create_task(self._solve_turnstile(task_id=task_id, url=url, sitekey=sitekey, action=action, cdata=cdata))
+            task_id = await self._create_task(url, sitekey, action, cdata)
+            if task_id is None:
+                if self.debug:
+                    logger.debug(f"Rejecting task: queue is full ({self.queue_depth}/{self.max_queue})")
+                return self._queue_full_response()
 
             if self.debug:
                 logger.debug(f"Request completed with taskid {task_id}.")
@@ -914,48 +1308,226 @@ class TurnstileAPIServer:
                 "errorDescription": "Invalid task ID/Request parameter"
             }), 200
 
-        result = await load_result(task_id)
-        if not result:
+        wait = self._parse_wait(request.args.get('wait'))
+
+        result = await load_result(task_id, consume=True)
+        if wait and result is not None and not result.is_final:
+            await self._wait_for_result(task_id, wait)
+            result = await load_result(task_id, consume=True) or result
+
+        body = self._format_result(result)
+        if result is not None and request.args.get('debug', '').lower() in ('1', 'true', 'yes'):
+            body["trace"] = result.trace
+        return jsonify(body), 200
+
+    async def get_traces(self):
+        """Handle GET /traces: recent stage timelines and per-stage aggregates."""
+        if not self._check_api_key():
             return jsonify({
                 "errorId": 1,
-                "errorCode": "ERROR_CAPTCHA_UNSOLVABLE",
-                "errorDescription": "Task not found"
-            }), 200
+                "errorCode": "ERROR_KEY_INVALID",
+                "errorDescription": "Invalid or missing API key"
+            }), 401
 
-        if result == "CAPTCHA_NOT_READY" or (isinstance(result, dict) and result.get("status") == "CAPTCHA_NOT_READY"):
-            return jsonify({"status": "processing"}), 200
+        try:
+            limit = int(request.args.get('limit', 50))
+        except ValueError:
+            limit = 50
+        return jsonify({
+            "errorId": 0,
+            "summary": self.traces.summary(),
+            "traces": self.traces.recent(limit)
+        }), 200
 
-        if isinstance(result, dict) and result.get("value") == "CAPTCHA_FAIL":
+    async def create_tasks(self):
+        """Handle POST /createTasks: create many tasks in one request."""
+        if not self._check_api_key():
             return jsonify({
                 "errorId": 1,
-                "errorCode": "ERROR_CAPTCHA_UNSOLVABLE",
-                "errorDescription": "Workers could not solve the Captcha"
-            }), 200
+                "errorCode": "ERROR_KEY_INVALID",
+                "errorDescription": "Invalid or missing API key"
+            }), 401
 
-        if isinstance(result, dict) and result.get("value") and result.get("value") != "CAPTCHA_FAIL":
+        data = await request.get_json(silent=True) or {}
+        items = data.get('tasks')
+        if not isinstance(items, list) or not items or len(items) > MAX_BATCH_SIZE:
             return jsonify({
-                "errorId": 0,
-                "status": "ready",
-                "solution": {
-                    "token": result["value"]
-                }
+                "errorId": 1,
+                "errorCode": "ERROR_BAD_PARAMETERS",
+                "errorDescription": f"'tasks' must be a list of 1-{MAX_BATCH_SIZE} items"
             }), 200
-        else:
+
+        tasks = []
+        rejected = 0
+        for item in items:
+            item = item if isinstance(item, dict) else {}
+            url = item.get('url') or item.get('websiteURL')
+            sitekey = item.get('sitekey') or item.get('websiteKey')
+            if not url or not sitekey:
+                tasks.append({
+                    "errorId": 1,
+                    "errorCode": "ERROR_WRONG_PAGEURL",
+                    "errorDescription": "Both 'url' and 'sitekey' are required"
+                })
+            else:
+                task_id = await self._create_task(url, sitekey, item.get('action'), item.get('cdata'))
+                if task_id is None:
+                    rejected += 1
+                    tasks.append({
+                        "errorId": 1,
+                        "errorCode": "ERROR_NO_SLOT_AVAILABLE",
+                        "errorDescription": "Task queue is full, retry later"
+                    })
+                else:
+                    tasks.append({"errorId": 0, "taskId": task_id})
+
+        if self.debug:
+            logger.debug(f"Batch request created {len(items) - rejected} tasks, rejected {rejected}")
+
+        if rejected and rejected == len(items):
+            return self._queue_full_response()
+        if rejected:
+            retry_after = self._retry_after()
+            return jsonify({"errorId": 0, "tasks": tasks, "retryAfter": retry_after}), 200, {"Retry-After": str(retry_after)}
+        return jsonify({"errorId": 0, "tasks": tasks}), 200
+
+    async def get_task_results(self):
+        """Handle POST /getTaskResults: fetch results for many task ids in one request."""
+        if not self._check_api_key():
             return jsonify({
                 "errorId": 1,
-                "errorCode": "ERROR_CAPTCHA_UNSOLVABLE",
-                "errorDescription": "Workers could not solve the Captcha"
+                "errorCode": "ERROR_KEY_INVALID",
+                "errorDescription": "Invalid or missing API key"
+            }), 401
+
+        data = await request.get_json(silent=True) or {}
+        task_ids = data.get('taskIds')
+        if not isinstance(task_ids, list) or not task_ids or len(task_ids) > MAX_BATCH_SIZE:
+            return jsonify({
+                "errorId": 1,
+                "errorCode": "ERROR_WRONG_CAPTCHA_ID",
+                "errorDescription": f"'taskIds' must be a list of 1-{MAX_BATCH_SIZE} task ids"
             }), 200
 
+        wait = self._parse_wait(data.get('wait'))
+        if wait:
+            # Long-poll until every listed task has finished or the wait expires
+            valid_ids = {task_id for task_id in task_ids if isinstance(task_id, str)}
+            waiters = [asyncio.shield(self._result_waiters[task_id]) for task_id in valid_ids if task_id in self._result_waiters]
+            if waiters:
+                _, pending = await asyncio.wait(waiters, timeout=wait)
+                for waiter in pending:
+                    waiter.cancel()
+
+        results = {}
+        for task_id in task_ids:
+            if not isinstance(task_id, str):
+                results[str(task_id)] = {
+                    "errorId": 1,
+                    "errorCode": "ERROR_WRONG_CAPTCHA_ID",
+                    "errorDescription": "Task id must be a string"
+                }
+                continue
+            results[task_id] = self._format_result(await load_result(task_id, consume=True))
+        return jsonify({"errorId": 0, "results": results}), 200
+
+    async def stream_results(self):
+        """Stream task results as Server-Sent Events the moment they finish."""
+        if not self._check_api_key():
+            return jsonify({
+                "errorId": 1,
+                "errorCode": "ERROR_KEY_INVALID",
+                "errorDescription": "Invalid or missing API key"
+            }), 401
+
+        ids = request.args.get('ids')
+        task_ids = {task_id for task_id in ids.split(',') if task_id} if ids else None
+
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def events():
+            pending = set(task_ids) if task_ids is not None else None
+            # Subscribe before looking at stored results so nothing finishes unseen in between
+            self._subscribers[queue] = task_ids
+            try:
+                if pending is not None:
+                    for task_id in list(pending):
+                        result = await load_result(task_id, consume=True)
+                        if result is not None and not result.is_final:
+                            continue  # still running, arrives through the queue
+                        if result is None:
+                            # Unknown or expired: the same error /result gives, not a failed solve
+                            event = {"taskId": task_id, **self._format_result(None)}
+                        else:
+                            event = self._result_event(task_id, result)
+                        pending.discard(task_id)
+                        yield f"event: result\ndata: {json.dumps(event)}\n\n".encode()
+
+                while pending is None or pending:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        yield b": keep-alive\n\n"
+                        continue
+                    if pending is not None:
+                        if event["taskId"] not in pending:
+                            continue
+                        pending.discard(event["taskId"])
+                    yield f"event: result\ndata: {json.dumps(event)}\n\n".encode()
+            finally:
+                self._subscribers.pop(queue, None)
+
+        response = await make_response(events(), {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        response.timeout = None
+        return response
+
     async def health_check(self):
         """Health check endpoint for Docker/Kubernetes."""
-        pool_size = self.browser_pool.qsize() if hasattr(self.browser_pool, 'qsize') else 0
-        return jsonify({
+        health = {
             "status": "ok",
-            "pool_size": pool_size,
+            "browser_type": self.browser_type,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "stream_subscribers": len(self._subscribers),
+            "token_stock": self.token_stock.stats() if self.token_stock else None
+        }
+        if self.worker_pool:
+            health.update(self.worker_pool.health(), thread_count=self.thread_count)
+        else:
+            health.update(self._pool_health())
+        return jsonify(health), 200
+
+    async def metrics_endpoint(self):
+        """Prometheus metrics of the solve pipeline, including worker processes."""
+        others = self.worker_pool.metric_snapshots() if self.worker_pool else ()
+        return self.metrics.render(others), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    def _browser_states(self) -> dict:
+        """Browser count per slot state, summed over worker processes in multi-process mode."""
+        if not self.worker_pool:
+            return self.browser_supervisor.stats()["states"]
+        states = {}
+        for snapshot in self.worker_pool.snapshots.values():
+            for state, count in snapshot.get("browsers", {}).get("states", {}).items():
+                states[state] = states.get(state, 0) + count
+        return states
+
+    def _pool_health(self) -> dict:
+        """Browser pool state of this process."""
+        return {
+            "pool_size": self.browser_supervisor.idle_count(),
             "thread_count": self.thread_count,
-            "browser_type": self.browser_type
-        }), 200
+            "browsers": self.browser_supervisor.stats(),
+            "autoscaler": self.autoscaler.stats() if self.autoscaler.enabled else None,
+            "context_pool": self.context_pool.stats(),
+            "site_profiles": self.site_profiles.stats(),
+            "proxies": self.proxy_manager.stats() if self.proxy_manager else None,
+            "response_cache": self.response_cache.stats() if self.response_cache.enabled else None
+        }
 
     @staticmethod
     async def index():
@@ -1020,33 +1592,63 @@ def parse_args():
     parser.add_argument('--no-headless', action='store_true', help='Run the browser with GUI (disable headless mode). By default, headless mode is enabled.')
     parser.add_argument('--useragent', type=str, help='User-Agent string (if not specified, random configuration is used)')
     parser.add_argument('--debug', action='store_true', help='Enable or disable debug mode for additional logging and troubleshooting information (default: False)')
-    parser.add_argument('--browser_type', type=str, default='chromium', help='Specify the browser type for the solver. Supported options: chromium, chrome, msedge, camoufox (default: chromium)')
+    parser.add_argument('--browser_type', type=str, default='chromium', help='Specify the browser type for the solver. Supported options: chromium, chrome, msedge, camoufox, simulated (in-process fake browsers for load testing) (default: chromium)')
     parser.add_argument('--thread', type=int, default=4, help='Set the number of browser threads to use for multi-threaded mode. Increasing this will speed up execution but requires more resources (default: 1)')
+    parser.add_argument('--min-threads', type=int, default=None, help='Browsers launched at startup when autoscaling; the pool never shrinks below this (default: --thread)')
+    parser.add_argument('--max-threads', type=int, default=None, help='Upper bound the pool grows to while tasks queue for a browser (default: --thread, no autoscaling)')
+    parser.add_argument('--memory-budget', type=float, default=0, help='MB the server and its browsers may use before autoscaling stops adding browsers; without a cgroup only their own RSS counts (default: 0 = container cgroup limit, or machine memory)')
+    parser.add_argument('--browser-memory', type=float, default=400, help='Expected MB per browser until real usage has been measured (default: 400)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes the browsers are spread over; the API runs in the main process (default: 1, everything in one process)')
     parser.add_argument('--proxy', action='store_true', help='Enable proxy support for the solver (Default: False)')
+    parser.add_argument('--proxy-file', type=str, default='proxies.txt', help='Proxy list used with --proxy, one per line; reloaded when it changes (default: proxies.txt)')
+    parser.add_argument('--proxy-sticky', action='store_true', help='Keep using the same proxy for a sitekey while that proxy stays healthy (default: False)')
+    parser.add_argument('--proxy-quarantine', type=float, default=60, help='Seconds a proxy is skipped after 3 failed solves in a row (default: 60)')
     parser.add_argument('--random', action='store_true', help='Use random User-Agent and Sec-CH-UA configuration from pool')
     parser.add_argument('--browser', type=str, help='Specify browser name to use (e.g., chrome, firefox)')
     parser.add_argument('--version', type=str, help='Specify browser version to use (e.g., 139, 141)')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Specify the IP address where the API solver runs. (Default: 127.0.0.1)')
     parser.add_argument('--port', type=str, default='5072', help='Set the port for the API solver to listen on. (Default: 5072)')
     parser.add_argument('--api-key', type=str, default=None, help='API key for authentication. If set, requests must include X-API-Key header or key= parameter.')
+    parser.add_argument('--max-queue', type=int, default=200, help='Maximum number of tasks waiting for a free browser. New tasks beyond this are rejected with ERROR_NO_SLOT_AVAILABLE; 0 disables the limit (default: 200)')
+    parser.add_argument('--queue-timeout', type=float, default=60, help='Maximum seconds a task may wait for a free browser before it fails with ERROR_NO_SLOT_AVAILABLE; 0 waits forever (default: 60)')
+    parser.add_argument('--prewarm-contexts', type=int, default=1, help='Number of ready browser contexts kept per browser so tasks skip context setup; 0 creates contexts on demand (default: 1)')
+    parser.add_argument('--context-uses', type=int, default=1, help='Solves a browser context may serve before it is closed; >1 reuses connections and cache per proxy (default: 1, fresh context per task)')
+    parser.add_argument('--context-max-age', type=float, default=300, help='Seconds after which a reused context is closed regardless of --context-uses (default: 300, 0 = no limit)')
+    parser.add_argument('--context-keep-cookies', action='store_true', help='Keep cookies when a context is reused; by default they are cleared between solves (default: False)')
+    parser.add_argument('--context-keep-storage', action='store_true', help='Keep localStorage, sessionStorage and IndexedDB when a context is reused; by default they are cleared between solves (default: False)')
+    parser.add_argument('--response-cache', type=float, default=64, help='MB of static responses (Turnstile api.js and assets) cached in memory and shared by all contexts; 0 disables (default: 64)')
+    parser.add_argument('--origin-stub', action='store_true', help='Serve a minimal local document for the target URL instead of loading the site; sites where this fails use real navigation (default: False)')
+    parser.add_argument('--trace-buffer', type=int, default=1000, help='Number of recent task stage timelines kept for /traces (default: 1000, 0 = disabled)')
+    parser.add_argument('--host-map', type=str, nargs='*', default=None, help='host=base_url pairs; browser requests for these hosts are served from base_url instead, e.g. challenges.cloudflare.com=http://127.0.0.1:8090 for offline benchmarks (default: none)')
+    parser.add_argument('--sim-solve-time', type=str, default='lognormal:2,0.5', help='--browser_type simulated: seconds per solve as fixed:S, uniform:MIN,MAX, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exponential:MEAN (default: lognormal:2,0.5)')
+    parser.add_argument('--sim-fail-rate', type=float, default=0.0, help='--browser_type simulated: fraction of solves that end in a Turnstile error (default: 0)')
+    parser.add_argument('--sim-crash-rate', type=float, default=0.0, help='--browser_type simulated: fraction of solves that crash their browser (default: 0)')
+    parser.add_argument('--site-profiles', type=int, default=1000, help='Number of sites (origin + sitekey) whose winning click strategy is remembered and tried first (default: 1000)')
+    parser.add_argument('--result-db', type=str, default=None, help='SQLite file to keep task results in, so they survive restarts and can be shared between processes (default: in memory)')
+    parser.add_argument('--result-ttl', type=float, default=300, help='Seconds a finished result is kept; Turnstile tokens expire after 300s (default: 300)')
+    parser.add_argument('--task-ttl', type=float, default=600, help='Seconds an unfinished task record is kept (default: 600)')
+    parser.add_argument('--max-results', type=int, default=100000, help='Maximum number of stored results; beyond it the least recently used (in memory) or soonest to expire (--result-db) are dropped (default: 100000)')
+    parser.add_argument('--recycle-solves', type=int, default=1000, help='Replace a browser with a fresh one after this many solves (default: 1000, 0 = never)')
+    parser.add_argument('--recycle-age', type=float, default=3600, help='Replace a browser after it has run this many seconds (default: 3600, 0 = never)')
+    parser.add_argument('--recycle-rss', type=float, default=0, help='Replace a browser once its process tree uses this many MB of RSS (default: 0 = never)')
+    parser.add_argument('--stock-file', type=str, default=None, help='JSON file listing {url, sitekey, action, cdata, count} tuples to keep pre-solved tokens for. /turnstile serves these from stock instantly (default: disabled)')
+    parser.add_argument('--stock-ttl', type=float, default=240, help='Seconds a stocked token stays valid for serving; keep below the 300s Turnstile validity window (default: 240)')
     return parser.parse_args()
 
 
-def create_app(headless: bool, useragent: str, debug: bool, browser_type: str, thread: int, proxy_support: bool, use_random_config: bool, browser_name: str, browser_version: str, api_key: str = None) -> Quart:
-    server = TurnstileAPIServer(headless=headless, useragent=useragent, debug=debug, browser_type=browser_type, thread=thread, proxy_support=proxy_support, use_random_config=use_random_config, browser_name=browser_name, browser_version=browser_version, api_key=api_key)
+def create_app(headless: bool, useragent: str, debug: bool, browser_type: str, thread: int, proxy_support: bool, use_random_config: bool, browser_name: str, browser_version: str, api_key: str = None, max_queue: int = 200, queue_timeout: float = 60, stock_file: str = None, stock_ttl: float = 240, prewarm_contexts: int = 1, site_profiles: int = 1000, result_db: str = None, result_ttl: float = 300, task_ttl: float = 600, max_results: int = 100000, recycle_solves: int = 1000, recycle_age: float = 3600, recycle_rss: float = 0, min_threads: int = None, max_threads: int = None, memory_budget: float = 0, browser_memory: float = 400, proxy_file: str = 'proxies.txt', proxy_sticky: bool = False, proxy_quarantine: float = 60, context_uses: int = 1, context_max_age: float = 300, context_keep_cookies: bool = False, context_keep_storage: bool = False, response_cache: float = 64, origin_stub: bool = False, trace_buffer: int = 1000, host_map: list = None, sim_solve_time: str = 'lognormal:2,0.5', sim_fail_rate: float = 0.0, sim_crash_rate: float = 0.0, workers: int = 1) -> Quart:
+    options = dict(headless=headless, useragent=useragent, debug=debug, browser_type=browser_type, thread=thread, proxy_support=proxy_support, use_random_config=use_random_config, browser_name=browser_name, browser_version=browser_version, api_key=api_key, max_queue=max_queue, queue_timeout=queue_timeout, stock_file=stock_file, stock_ttl=stock_ttl, prewarm_contexts=prewarm_contexts, site_profiles=site_profiles, result_db=result_db, result_ttl=result_ttl, task_ttl=task_ttl, max_results=max_results, recycle_solves=recycle_solves, recycle_age=recycle_age, recycle_rss=recycle_rss, min_threads=min_threads, max_threads=max_threads, memory_budget=memory_budget, browser_memory=browser_memory, proxy_file=proxy_file, proxy_sticky=proxy_sticky, proxy_quarantine=proxy_quarantine, context_uses=context_uses, context_max_age=context_max_age, context_keep_cookies=context_keep_cookies, context_keep_storage=context_keep_storage, response_cache=response_cache, origin_stub=origin_stub, trace_buffer=trace_buffer, host_map=host_map, sim_solve_time=sim_solve_time, sim_fail_rate=sim_fail_rate, sim_crash_rate=sim_crash_rate)
+    worker_pool = WorkerPool(workers, options) if workers > 1 and thread > 1 else None
+    if worker_pool and (min_threads is not None or max_threads is not None or memory_budget):
+        logger.warning("--min-threads, --max-threads and --memory-budget are ignored with --workers > 1: each worker keeps a fixed share of --thread browsers")
+    server = TurnstileAPIServer(worker_pool=worker_pool, **options)
     return server.app
 
 
 if __name__ == '__main__':
     args = parse_args()
-    browser_types = [
-        'chromium',
-        'chrome',
-        'msedge',
-        'camoufox',
-    ]
-    if args.browser_type not in browser_types:
-        logger.error(f"Unknown browser type: {COLORS.get('RED')}{args.browser_type}{COLORS.get('RESET')} Available browser types: {browser_types}")
+    if args.browser_type not in BROWSER_TYPES:
+        logger.error(f"Unknown browser type: {COLORS.get('RED')}{args.browser_type}{COLORS.get('RESET')} Available browser types: {list(BROWSER_TYPES)}")
     else:
         app = create_app(
             headless=not args.no_headless, 
@@ -1058,7 +1660,39 @@ if __name__ == '__main__':
             use_random_config=args.random,
             browser_name=args.browser,
             browser_version=args.version,
-            api_key=args.api_key
+            api_key=args.api_key,
+            max_queue=args.max_queue,
+            queue_timeout=args.queue_timeout,
+            stock_file=args.stock_file,
+            stock_ttl=args.stock_ttl,
+            prewarm_contexts=args.prewarm_contexts,
+            site_profiles=args.site_profiles,
+            result_db=args.result_db,
+            result_ttl=args.result_ttl,
+            task_ttl=args.task_ttl,
+            max_results=args.max_results,
+            recycle_solves=args.recycle_solves,
+            recycle_age=args.recycle_age,
+            recycle_rss=args.recycle_rss,
+            min_threads=args.min_threads,
+            max_threads=args.max_threads,
+            memory_budget=args.memory_budget,
+            browser_memory=args.browser_memory,
+            proxy_file=args.proxy_file,
+            proxy_sticky=args.proxy_sticky,
+            proxy_quarantine=args.proxy_quarantine,
+            context_uses=args.context_uses,
+            context_max_age=args.context_max_age,
+            context_keep_cookies=args.context_keep_cookies,
+            context_keep_storage=args.context_keep_storage,
+            response_cache=args.response_cache,
+            origin_stub=args.origin_stub,
+            trace_buffer=args.trace_buffer,
+            host_map=args.host_map,
+            sim_solve_time=args.sim_solve_time,
+            sim_fail_rate=args.sim_fail_rate,
+            sim_crash_rate=args.sim_crash_rate,
+            workers=args.workers
         )
         if args.api_key:
             logger.info(f"API Key authentication enabled")
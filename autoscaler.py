@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Optional
+
+import psutil
+
+
+# Seconds between scaling decisions
+SCALE_INTERVAL = 2
+# Grow when tasks waited this long on average for a browser
+SCALE_UP_WAIT = 2.0
+# Shrink by one browser after the pool had idle browsers and no queue for this long
+SCALE_DOWN_IDLE = 60
+# Fraction of the memory budget kept free when deciding to launch another browser
+MEMORY_HEADROOM = 0.1
+
+_UNLIMITED = 2 ** 60
+
+
+def _logger() -> logging.Logger:
+    # Looked up lazily: api_solver registers its CustomLogger class after importing this module
+    return logging.getLogger("TurnstileAPIServer")
+
+
+def _read_number(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if not value.isdigit():
+        return None  # "max": no limit
+    return int(value)
+
+
+# (limit, usage) files of cgroup v2 and v1
+_CGROUP_FILES = (
+    ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+    ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+)
+
+
+def _cgroup_memory():
+    """(limit, usage) in bytes of the container, None if it has no memory limit."""
+    for limit_path, usage_path in _CGROUP_FILES:
+        limit = _read_number(limit_path)
+        if limit and limit < _UNLIMITED:
+            return limit, _read_number(usage_path) or 0
+    return None
+
+
+def memory_limit_mb() -> float:
+    """Memory limit of the container, else of the machine."""
+    cgroup = _cgroup_memory()
+    return (cgroup[0] if cgroup else psutil.virtual_memory().total) / 2**20
+
+
+def memory_used_mb() -> float:
+    """Memory charged to the container, else resident memory of this server and its browsers.
+
+    Without a cgroup the machine is shared, so other processes on it do not
+    count against the budget.
+    """
+    cgroup = _cgroup_memory()
+    if cgroup:
+        return cgroup[1] / 2**20
+    try:
+        server = psutil.Process(os.getpid())
+        processes = [server] + server.children(recursive=True)
+    except psutil.Error:
+        return 0.0
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 2**20
+
+
+def memory_available_mb() -> float:
+    """Memory the machine can still hand out."""
+    return psutil.virtual_memory().available / 2**20
+
+
+class PoolAutoscaler:
+    """Grows the browser pool under queueing and shrinks it when idle.
+
+    The pool stays between ``min_threads`` and ``max_threads`` browsers and a
+    browser is only launched if the expected footprint of one more still fits
+    the memory budget.
+    """
+
+    def __init__(self, supervisor, config_factory: Callable[[], dict], queue_depth: Callable[[], int],
+                 min_threads: int, max_threads: int, budget_mb: float = 0, browser_mb: float = 400, debug: bool = False):
+        self.supervisor = supervisor
+        self.config_factory = config_factory  # config for the next browser to launch
+        self.queue_depth = queue_depth
+        self.min_threads = min_threads
+        self.max_threads = max(max_threads, min_threads)
+        self.budget_mb = budget_mb or memory_limit_mb()
+        self.browser_mb = browser_mb
+        self.debug = debug
+        self.avg_wait = 0.0
+        self.idle_since = None
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.blocked_by_memory = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_threads > self.min_threads
+
+    def observe_wait(self, wait: float) -> None:
+        """Track how long tasks waited for a browser."""
+        self.avg_wait = 0.8 * self.avg_wait + 0.2 * wait
+
+    def _browser_estimate(self) -> float:
+        measured = [slot.rss_mb for slot in self.supervisor.slots.values() if slot.rss_mb]
+        return max(self.browser_mb, sum(measured) / len(measured)) if measured else self.browser_mb
+
+    def _fits_memory(self) -> bool:
+        estimate = self._browser_estimate()
+        # The budget covers this server; the machine must still have room for the browser as well
+        return (memory_used_mb() + estimate <= self.budget_mb * (1 - MEMORY_HEADROOM)
+                and estimate <= memory_available_mb())
+
+    async def _grow(self) -> None:
+        size = len(self.supervisor.slots)
+        if not await asyncio.get_running_loop().run_in_executor(None, self._fits_memory):
+            self.blocked_by_memory += 1
+            if self.debug:
+                _logger().debug(f"Autoscaler: Not growing past {size} browsers, memory budget of {self.budget_mb:.0f}MB reached")
+            return
+        index = max(self.supervisor.slots, default=0) + 1
+        if await self.supervisor.start(index, self.config_factory()):
+            self.scale_ups += 1
+            _logger().info(f"Autoscaler: Pool grown to {len(self.supervisor.slots)} browsers (queue {self.queue_depth()}, avg wait {self.avg_wait:.1f}s)")
+
+    async def _shrink(self) -> None:
+        if await self.supervisor.retire():
+            self.scale_downs += 1
+            _logger().info(f"Autoscaler: Pool shrunk to {len(self.supervisor.slots)} browsers after {SCALE_DOWN_IDLE}s idle")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(SCALE_INTERVAL)
+            try:
+                size = len(self.supervisor.slots)
+                depth = self.queue_depth()
+                idle = self.supervisor.idle_count()
+
+                if depth and not idle and size < self.max_threads and (self.avg_wait >= SCALE_UP_WAIT or depth >= size):
+                    self.idle_since = None
+                    await self._grow()
+                    continue
+
+                if depth or not idle:
+                    self.idle_since = None
+                    continue
+                # Waits observed before the queue drained no longer describe the load
+                self.avg_wait = 0.0
+                now = time.time()
+                if self.idle_since is None:
+                    self.idle_since = now
+                elif now - self.idle_since >= SCALE_DOWN_IDLE and size > self.min_threads:
+                    self.idle_since = now
+                    await self._shrink()
+            except Exception as e:
+                _logger().error(f"Autoscaler: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "min_threads": self.min_threads,
+            "max_threads": self.max_threads,
+            "memory_budget_mb": round(self.budget_mb),
+            "browser_estimate_mb": round(self._browser_estimate()),
+            "avg_queue_wait": round(self.avg_wait, 3),
+            "scale_ups": self.scale_ups,
+            "scale_downs": self.scale_downs,
+            "blocked_by_memory": self.blocked_by_memory
+        }
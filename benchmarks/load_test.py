@@ -0,0 +1,106 @@
+"""Load generator for a running solver: sustained tasks through /turnstile and /result.
+
+Each of --concurrency threads creates a task, long-polls /result until it
+finishes and starts the next one, for --duration seconds. Reports finished
+tasks, rejections and latency percentiles. Run from the repository root:
+
+    python benchmarks/load_test.py --server http://127.0.0.1:5072 --url https://bench.local/ --concurrency 20 --duration 60
+"""
+import json
+import time
+import argparse
+import threading
+from typing import Optional
+
+import requests
+
+TEST_SITEKEY = "1x00000000000000000000AA"
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 3)
+
+
+def _solve(session, server, params, headers, timeout):
+    """One task from creation to result: (outcome, seconds)."""
+    start = time.time()
+    response = session.get(f"{server}/turnstile", params=params, headers=headers, timeout=30)
+    if response.status_code == 429:
+        return "rejected", time.time() - start
+    data = response.json()
+    task_id = data.get("taskId")
+    if not task_id:
+        return "rejected" if data.get("errorCode") == "ERROR_NO_SLOT_AVAILABLE" else "failed", time.time() - start
+
+    while time.time() - start < timeout:
+        data = session.get(f"{server}/result", params={"id": task_id, "wait": 20}, headers=headers, timeout=40).json()
+        if data.get("status") == "ready":
+            return "ok", time.time() - start
+        if data.get("errorId"):
+            return "failed", time.time() - start
+    return "timeout", time.time() - start
+
+
+def run(server: str, url: str, sitekey: str = TEST_SITEKEY, concurrency: int = 10, duration: float = 60,
+        api_key: Optional[str] = None, timeout: float = 120) -> dict:
+    """Keep ``concurrency`` tasks in flight for ``duration`` seconds and return the summary."""
+    server = server.rstrip("/")
+    params = {"url": url, "sitekey": sitekey}
+    headers = {"X-API-Key": api_key} if api_key else {}
+    outcomes = {"ok": 0, "failed": 0, "rejected": 0, "timeout": 0, "error": 0}
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.time() < deadline:
+            try:
+                outcome, elapsed = _solve(session, server, params, headers, timeout)
+            except (requests.RequestException, ValueError):
+                outcome, elapsed = "error", None
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(elapsed)
+            if outcome in ("rejected", "error"):
+                time.sleep(1)
+
+    started = time.time()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 1),
+        "tasks": sum(outcomes.values()),
+        **outcomes,
+        "solves_per_min": round(outcomes["ok"] * 60 / elapsed, 1),
+        "p50": _percentile(latencies, 0.5),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sustained load against a running solver")
+    parser.add_argument("--server", default="http://127.0.0.1:5072")
+    parser.add_argument("--url", default="https://bench.local/")
+    parser.add_argument("--sitekey", default=TEST_SITEKEY)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a single task counts as timed out")
+    parser.add_argument("--api-key", default=None)
+    args = parser.parse_args()
+    print(json.dumps(run(args.server, args.url, args.sitekey, args.concurrency, args.duration, args.api_key, args.timeout), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Local stand-in for challenges.cloudflare.com and a target site.
+
+Serves a fake ``/turnstile/v0/api.js`` that renders ``.cf-turnstile``
+containers implicitly on load and through ``turnstile.render``, and calls
+the widget callback after a configurable delay, either on its own
+(``auto``) or once the widget is clicked (``click``), plus a fake target
+page with some blockable images and styles. Point the solver at it with
+--host-map:
+
+    python benchmarks/mock_turnstile.py --port 8090 --mode click --solve-delay 800
+    python api_solver.py --host-map challenges.cloudflare.com=http://127.0.0.1:8090 bench.local=http://127.0.0.1:8090
+
+and create tasks for ``https://bench.local/`` with any sitekey.
+"""
+import json
+import argparse
+
+from quart import Quart, Response
+
+API_JS = """
+(function () {
+    const config = %(config)s;
+    let counter = 0;
+
+    function newToken() {
+        return "MOCK." + Date.now().toString(36) + "." + Math.random().toString(36).slice(2) + "." + "x".repeat(config.tokenLength);
+    }
+
+    function render(container, options) {
+        const element = typeof container === "string" ? document.querySelector(container) : container;
+        // Like the real api.js, a container is only rendered once
+        if (element.dataset.mockTurnstile) return element.dataset.mockTurnstile;
+        const id = "mock-turnstile-" + (++counter);
+        element.dataset.mockTurnstile = id;
+        const box = document.createElement("div");
+        box.id = id;
+        box.style.cssText = "width:300px;height:65px;border:1px solid #ccc;display:flex;align-items:center;padding-left:12px;background:#fafafa;cursor:pointer";
+        box.innerHTML = '<input type="checkbox" style="width:24px;height:24px"><span style="margin-left:8px">Verify you are human</span>';
+        element.appendChild(box);
+
+        let started = false;
+        const solve = () => {
+            if (started) return;
+            started = true;
+            setTimeout(() => {
+                if (Math.random() < config.failRate) {
+                    if (options["error-callback"]) options["error-callback"]("300030");
+                    return;
+                }
+                const token = newToken();
+                const input = document.createElement("input");
+                input.type = "hidden";
+                input.name = "cf-turnstile-response";
+                input.value = token;
+                element.appendChild(input);
+                if (options.callback) options.callback(token);
+            }, config.delay + Math.random() * config.jitter);
+        };
+        if (config.mode === "click") {
+            element.addEventListener("click", solve);
+        } else {
+            solve();
+        }
+        return id;
+    }
+
+    // Implicit rendering of .cf-turnstile containers, with data-* callbacks named on window
+    function renderImplicit() {
+        document.querySelectorAll(".cf-turnstile").forEach((element) => {
+            render(element, {
+                sitekey: element.dataset.sitekey,
+                callback: (token) => window[element.dataset.callback] && window[element.dataset.callback](token),
+                "error-callback": (error) => window[element.dataset.errorCallback] && window[element.dataset.errorCallback](error)
+            });
+        });
+    }
+
+    window.turnstile = {
+        render: render,
+        reset: function () {},
+        remove: function () {},
+        getResponse: function () {
+            const input = document.querySelector('input[name="cf-turnstile-response"]');
+            return input ? input.value : undefined;
+        }
+    };
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", renderImplicit);
+    } else {
+        renderImplicit();
+    }
+})();
+"""
+
+
+def create_app(mode: str = "auto", solve_delay: float = 500, jitter: float = 200, fail_rate: float = 0, page_kb: int = 200) -> Quart:
+    app = Quart(__name__)
+    config = json.dumps({"mode": mode, "delay": solve_delay, "jitter": jitter, "failRate": fail_rate, "tokenLength": 600})
+    api_js = API_JS % {"config": config}
+    images = "".join(f'<img src="/img/{i}.png" width="64" height="64">' for i in range(10))
+    filler = "<p>" + "Lorem ipsum dolor sit amet. " * 36 + "</p>"
+    page = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Bench site</title>'
+            f'<link rel="stylesheet" href="/style.css"></head><body><h1>Bench site</h1>{images}'
+            f'{filler * max(1, page_kb)}</body></html>')
+
+    @app.route("/turnstile/v0/api.js")
+    async def turnstile_api():
+        return Response(api_js, content_type="text/javascript", headers={"Cache-Control": "max-age=300"})
+
+    @app.route("/style.css")
+    async def style():
+        return Response("body { font-family: sans-serif; }" * 200, content_type="text/css")
+
+    @app.route("/img/<int:number>.png")
+    async def image(number: int):
+        return Response(b"\x89PNG\r\n\x1a\n" + bytes(20000), content_type="image/png")
+
+    @app.route("/", defaults={"path": ""})
+    @app.route("/<path:path>")
+    async def site(path: str):
+        return Response(page, content_type="text/html")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Turnstile api.js and target site")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--mode", choices=["auto", "click"], default="auto", help="Solve by itself or only after the widget is clicked")
+    parser.add_argument("--solve-delay", type=float, default=500, help="Milliseconds from render (or click) to token")
+    parser.add_argument("--jitter", type=float, default=200, help="Random extra milliseconds added to each solve")
+    parser.add_argument("--fail-rate", type=float, default=0, help="Fraction of widgets that call error-callback instead")
+    parser.add_argument("--page-kb", type=int, default=200, help="Approximate size of the target page in KB")
+    args = parser.parse_args()
+    create_app(args.mode, args.solve_delay, args.jitter, args.fail_rate, args.page_kb).run(host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Solve time and traffic: real page navigation vs --origin-stub.
+
+Solves the same sites alternately in both modes on one browser and reports
+per mode the median/mean solve time, success count and bytes received.
+Each solve is counted under the mode it finished in, so a site the stub
+does not work for shows up under navigate.
+The default sitekey is Cloudflare's always-passing test key, which works on
+any origin. Needs a browser and network access. Run from the repository root:
+
+    python benchmarks/navigation_modes.py --url https://example.com https://www.wikipedia.org --rounds 5
+"""
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_solver import TurnstileAPIServer  # noqa: E402
+from task_trace import TaskTrace  # noqa: E402
+
+TEST_SITEKEY = "1x00000000000000000000AA"
+# TaskTrace.mode of the last navigation of a solve -> column label
+MODES = {"navigate": "navigate", "stub": "origin-stub"}
+
+
+class BenchServer(TurnstileAPIServer):
+    """Counts response bytes of every context it creates."""
+
+    bytes_received = 0
+
+    async def _new_context_page(self, index, browser, browser_config, proxy=None):
+        context, page = await super()._new_context_page(index, browser, browser_config, proxy)
+        context.on("requestfinished", lambda request: asyncio.ensure_future(self._count(request)))
+        return context, page
+
+    async def _count(self, request):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self.bytes_received += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+
+
+async def solve(server, url, sitekey, stub):
+    server.origin_stub = stub
+    index, browser, browser_config = await server.browser_supervisor.acquire()
+    before = server.bytes_received
+    trace = TaskTrace()
+    token, elapsed = await server._run_solve(index, browser, browser_config, url, sitekey, trace=trace)
+    # Late responses of this solve are still being counted
+    await asyncio.sleep(0.5)
+    return trace.mode, (token is not None, elapsed, server.bytes_received - before)
+
+
+async def run(args):
+    server = BenchServer(headless=not args.no_headless, useragent=None, debug=False, browser_type=args.browser_type,
+                         thread=1, proxy_support=False, response_cache=args.response_cache)
+    await server._initialize_browser()
+
+    results = {mode: [] for mode in MODES}
+    for round_number in range(args.rounds):
+        for url in args.url:
+            # Alternate the order so neither mode always gets the warmer cache
+            for stub in ((False, True) if round_number % 2 == 0 else (True, False)):
+                mode, row = await solve(server, url, args.sitekey, stub)
+                # A solve that failed before navigating counts under the mode it asked for
+                results[mode or ("stub" if stub else "navigate")].append(row)
+
+    print(f"{'mode':>12} {'solves':>7} {'ok':>4} {'median s':>9} {'mean s':>7} {'KB/solve':>9}")
+    for mode, name in MODES.items():
+        rows = results[mode]
+        if not rows:
+            print(f"{name:>12} {0:>7}")
+            continue
+        times = [elapsed for ok, elapsed, _ in rows if ok] or [0]
+        print(f"{name:>12} {len(rows):>7} {sum(ok for ok, _, _ in rows):>4} {statistics.median(times):>9.2f} "
+              f"{statistics.mean(times):>7.2f} {statistics.mean(received for _, _, received in rows) / 1024:>9.1f}")
+    print(f"site_profiles: {server.site_profiles.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare real navigation with the origin stub")
+    parser.add_argument("--url", nargs="+", default=["https://example.com"])
+    parser.add_argument("--sitekey", default=TEST_SITEKEY)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--browser_type", default="chromium")
+    parser.add_argument("--response-cache", type=float, default=64)
+    parser.add_argument("--no-headless", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
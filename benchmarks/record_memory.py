@@ -0,0 +1,84 @@
+"""Memory used by task records: legacy dicts vs slotted TaskRecord.
+
+Builds N records the way the server does (one pending record per task,
+half of them finished with a token) and reports traced memory per record.
+Run from the repository root:
+
+    python benchmarks/record_memory.py --counts 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_results import TaskRecord  # noqa: E402
+
+SITES = 50
+TOKEN_LENGTH = 700
+
+
+def _request_strings(i):
+    # Query parsing yields fresh string objects per request, even for the same site
+    site = i % SITES
+    return "".join(["https://site", str(site), ".example.com/login"]), "".join(["0x4AAAAAAA", str(site).zfill(12)])
+
+
+def _token(i):
+    return str(i).rjust(TOKEN_LENGTH, "x")
+
+
+def build_dicts(count):
+    records = {}
+    for i in range(count):
+        url, sitekey = _request_strings(i)
+        records[str(i)] = {
+            "status": "CAPTCHA_NOT_READY",
+            "createTime": int(time.time()),
+            "url": url,
+            "sitekey": sitekey,
+            "action": None,
+            "cdata": None
+        }
+        if i % 2:
+            records[str(i)] = {"value": _token(i), "elapsed_time": 4.2}
+    return records
+
+
+def build_records(count):
+    records = {}
+    for i in range(count):
+        url, sitekey = _request_strings(i)
+        record = TaskRecord.pending(url, sitekey)
+        if i % 2:
+            record.finish(_token(i), 4.2)
+        records[str(i)] = record
+    return records
+
+
+def measure(builder, count):
+    tracemalloc.start()
+    records = builder(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare task record memory usage")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'dict MB':>10} {'slots MB':>10} {'dict B/rec':>11} {'slots B/rec':>12} {'saved':>7}")
+    for count in args.counts:
+        as_dicts = measure(build_dicts, count)
+        as_records = measure(build_records, count)
+        print(f"{count:>10} {as_dicts / 2**20:>10.1f} {as_records / 2**20:>10.1f} "
+              f"{as_dicts / count:>11.0f} {as_records / count:>12.0f} {1 - as_records / as_dicts:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
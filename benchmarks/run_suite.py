@@ -0,0 +1,112 @@
+"""Offline throughput suite: the real solver against a local mock Turnstile.
+
+Starts benchmarks/mock_turnstile.py, then for each --threads value starts
+api_solver.py with --host-map pointing challenges.cloudflare.com and the
+bench site at the mock, runs benchmarks/load_test.py against it and stops
+it again. Needs a browser but no network access, so numbers are repeatable
+and comparable between commits (save them with --json). Run from the
+repository root:
+
+    python benchmarks/run_suite.py --threads 1 4 8 --duration 60 --mode click --json before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import requests
+
+import load_test
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_HOST = "bench.local"
+
+
+def _wait_ready(url: str, ready, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            response = requests.get(url, timeout=2)
+            if response.ok and ready(response):
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_case(args, threads: int, mock: str) -> dict:
+    command = [sys.executable, os.path.join(ROOT, "api_solver.py"), "--thread", str(threads), "--port", str(args.port),
+               "--host", "127.0.0.1", "--browser_type", args.browser_type,
+               "--max-queue", "0", "--host-map", f"challenges.cloudflare.com={mock}", f"{BENCH_HOST}={mock}"]
+    command += args.solver_args
+    solver = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = f"http://127.0.0.1:{args.port}"
+    try:
+        _wait_ready(f"{server}/health", lambda response: (response.json().get("pool_size") or 0) >= threads, 180, solver)
+        result = load_test.run(server, f"https://{BENCH_HOST}/", concurrency=threads * args.per_thread, duration=args.duration)
+    finally:
+        _stop(solver)
+    return {"threads": threads, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline solver throughput against a mock Turnstile")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--per-thread", type=int, default=2, help="Tasks kept in flight per browser thread")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of load per case")
+    parser.add_argument("--port", type=int, default=5090, help="Port for the solver under test")
+    parser.add_argument("--mock-port", type=int, default=8090)
+    parser.add_argument("--mode", choices=["auto", "click"], default="click")
+    parser.add_argument("--solve-delay", type=float, default=500)
+    parser.add_argument("--jitter", type=float, default=200)
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--page-kb", type=int, default=200)
+    parser.add_argument("--browser_type", default="chromium")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    parser.add_argument("solver_args", nargs=argparse.REMAINDER, help="Extra api_solver.py arguments after --")
+    args = parser.parse_args()
+    args.solver_args = [arg for arg in args.solver_args if arg != "--"]
+
+    mock = f"http://127.0.0.1:{args.mock_port}"
+    mock_process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "mock_turnstile.py"), "--port", str(args.mock_port),
+         "--mode", args.mode, "--solve-delay", str(args.solve_delay), "--jitter", str(args.jitter),
+         "--fail-rate", str(args.fail_rate), "--page-kb", str(args.page_kb)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    results = []
+    try:
+        _wait_ready(f"{mock}/turnstile/v0/api.js", lambda response: True, 30, mock_process)
+        for threads in args.threads:
+            results.append(run_case(args, threads, mock))
+            print(f"threads={threads}: {results[-1]}", flush=True)
+    finally:
+        _stop(mock_process)
+
+    print(f"{'threads':>7} {'tasks':>6} {'ok':>6} {'failed':>6} {'rejected':>8} {'p50 s':>6} {'p95 s':>6} {'p99 s':>6} {'solves/min':>10}")
+    for row in results:
+        print(f"{row['threads']:>7} {row['tasks']:>6} {row['ok']:>6} {row['failed'] + row['timeout'] + row['error']:>6} "
+              f"{row['rejected']:>8} {row['p50'] or 0:>6.2f} {row['p95'] or 0:>6.2f} {row['p99'] or 0:>6.2f} {row['solves_per_min']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": {key: value for key, value in vars(args).items() if key != "json"}, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
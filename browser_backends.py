@@ -0,0 +1,282 @@
+import uuid
+import random
+import asyncio
+import inspect
+from typing import Callable, List
+
+
+CHROMIUM_CHANNELS = ('chromium', 'chrome', 'msedge')
+BROWSER_TYPES = CHROMIUM_CHANNELS + ('camoufox', 'simulated')
+
+
+class BrowserBackend:
+    """Starts the browsers of the pool.
+
+    ``launch`` returns a browser with the part of the Playwright API the
+    solver uses: ``new_context()`` (whose contexts have ``new_page()``),
+    ``close()``, ``is_connected()`` and the ``disconnected`` event.
+    """
+
+    name = "base"
+
+    async def start(self) -> None:
+        """Prepare the driver; called once per process before the first launch."""
+
+    async def launch(self, args: List[str]):
+        raise NotImplementedError
+
+
+class ChromiumBackend(BrowserBackend):
+    """Chromium, Chrome or Edge through patchright."""
+
+    def __init__(self, channel: str, headless: bool):
+        self.name = channel
+        self.channel = channel
+        self.headless = headless
+        self._playwright = None
+
+    async def start(self) -> None:
+        from patchright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+
+    async def launch(self, args: List[str]):
+        return await self._playwright.chromium.launch(channel=self.channel, headless=self.headless, args=args)
+
+
+class CamoufoxBackend(BrowserBackend):
+    name = "camoufox"
+
+    def __init__(self, headless: bool):
+        self.headless = headless
+        self._camoufox = None
+
+    async def start(self) -> None:
+        from camoufox.async_api import AsyncCamoufox
+        self._camoufox = AsyncCamoufox(headless=self.headless)
+
+    async def launch(self, args: List[str]):
+        return await self._camoufox.start()
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """Sampler of seconds for ``name:a,b`` specs.
+
+    ``fixed:S``, ``uniform:MIN,MAX``, ``normal:MEAN,SD``,
+    ``lognormal:MEDIAN,SIGMA`` and ``exponential:MEAN``; negative samples
+    are clamped to 0.
+    """
+    name, _, values = spec.partition(':')
+    try:
+        params = [float(value) for value in values.split(',')] if values else []
+    except ValueError:
+        raise ValueError(f"Invalid distribution parameters: {spec}")
+    samplers = {
+        'fixed': (1, lambda s: s),
+        'uniform': (2, random.uniform),
+        'normal': (2, random.gauss),
+        'lognormal': (2, lambda median, sigma: median * random.lognormvariate(0, sigma)),
+        'exponential': (1, lambda mean: random.expovariate(1 / mean) if mean > 0 else 0)
+    }
+    if name not in samplers or len(params) != samplers[name][0]:
+        raise ValueError(f"Invalid distribution: {spec} (expected fixed:S, uniform:MIN,MAX, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exponential:MEAN)")
+    sample = samplers[name][1]
+    return lambda: max(0.0, sample(*params))
+
+
+class _Events:
+    def __init__(self):
+        self._handlers = {}
+
+    def on(self, event: str, handler) -> None:
+        self._handlers.setdefault(event, []).append(handler)
+
+    def emit(self, event: str, *args) -> None:
+        for handler in self._handlers.get(event, ()):
+            handler(*args)
+
+
+class _Mouse:
+    async def click(self, x: float, y: float, **kwargs) -> None:
+        await asyncio.sleep(0)
+
+
+class SimulatedPage(_Events):
+    """Page whose injected widget reports a token (or error) after a sampled delay."""
+
+    def __init__(self, context: "SimulatedContext"):
+        super().__init__()
+        self.context = context
+        self.main_frame = object()
+        self.mouse = _Mouse()
+        self.url = "about:blank"
+        self.frames = [self]
+        self._closed = False
+        self._timer = None
+        self._token = None
+
+    def _check(self) -> None:
+        if self._closed or not self.context.browser.is_connected():
+            raise RuntimeError("Target page, context or browser has been closed")
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    async def add_init_script(self, script: str) -> None:
+        self._check()
+
+    async def set_viewport_size(self, size: dict) -> None:
+        self._check()
+
+    async def route(self, url, handler) -> None:
+        self._check()
+
+    async def unroute(self, url, handler=None) -> None:
+        pass
+
+    async def goto(self, url: str, **kwargs) -> None:
+        self._check()
+        self._cancel()
+        self.url = url
+        await asyncio.sleep(0)
+
+    async def evaluate(self, script: str, *args):
+        self._check()
+        await asyncio.sleep(0)
+        if "turnstile.render" in script:
+            self._cancel()
+            self._timer = asyncio.get_running_loop().call_later(self.context.browser.backend.solve_time(), self._finish)
+            return None
+        if "cf-turnstile-response" in script:
+            return self._token
+        return None
+
+    def _cancel(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+        self._timer = None
+        self._token = None
+
+    def _finish(self) -> None:
+        self._timer = None
+        backend = self.context.browser.backend
+        if random.random() < backend.crash_rate:
+            self.context.browser.crash()
+            return
+        if random.random() < backend.fail_rate:
+            self.context.report(self, 'error', '300030')
+            return
+        self._token = f"sim.{uuid.uuid4().hex}"
+        self.context.report(self, 'token', self._token)
+
+    async def close(self) -> None:
+        self._cancel()
+        self._closed = True
+
+
+class SimulatedContext(_Events):
+    def __init__(self, browser: "SimulatedBrowser", options: dict):
+        super().__init__()
+        self.browser = browser
+        self.options = options
+        self.pages = []
+        self._bindings = {}
+        self._closed = False
+
+    def _check(self) -> None:
+        if self._closed or not self.browser.is_connected():
+            raise RuntimeError("Target page, context or browser has been closed")
+
+    async def route(self, url, handler) -> None:
+        self._check()
+
+    async def unroute(self, url, handler=None) -> None:
+        pass
+
+    async def expose_binding(self, name: str, callback) -> None:
+        self._check()
+        self._bindings[name] = callback
+
+    async def clear_cookies(self) -> None:
+        self._check()
+
+    async def new_page(self) -> SimulatedPage:
+        self._check()
+        page = SimulatedPage(self)
+        self.pages.append(page)
+        return page
+
+    def report(self, page: SimulatedPage, kind: str, value: str) -> None:
+        """What the injected callbacks do: call the exposed binding."""
+        callback = self._bindings.get("__turnstileReport")
+        if callback is None:
+            return
+        result = callback({"page": page, "context": self, "frame": page.main_frame}, kind, value)
+        if inspect.isawaitable(result):
+            asyncio.ensure_future(result)
+
+    async def close(self) -> None:
+        for page in self.pages:
+            await page.close()
+        self._closed = True
+        self.browser.contexts.discard(self)
+
+
+class SimulatedBrowser(_Events):
+    def __init__(self, backend: "SimulatedBackend"):
+        super().__init__()
+        self.backend = backend
+        self.contexts = set()
+        self._connected = True
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def new_context(self, **options) -> SimulatedContext:
+        if not self._connected:
+            raise RuntimeError("Browser has been closed")
+        await asyncio.sleep(0)
+        context = SimulatedContext(self, options)
+        self.contexts.add(context)
+        return context
+
+    def crash(self) -> None:
+        if self._connected:
+            self._connected = False
+            self.emit("disconnected", self)
+
+    async def close(self) -> None:
+        for context in list(self.contexts):
+            await context.close()
+        self.crash()
+
+
+class SimulatedBackend(BrowserBackend):
+    """In-process fake browsers for load testing the API, queueing and result store.
+
+    No browser is started: an injected widget reports its token after
+    ``solve_time`` seconds, reports a Turnstile error with probability
+    ``fail_rate`` and takes its whole browser down with probability
+    ``crash_rate``.
+    """
+
+    name = "simulated"
+
+    def __init__(self, solve_time: str = 'lognormal:2,0.5', fail_rate: float = 0.0, crash_rate: float = 0.0):
+        self.solve_time = parse_distribution(solve_time)
+        self.fail_rate = fail_rate
+        self.crash_rate = crash_rate
+
+    async def launch(self, args: List[str]) -> SimulatedBrowser:
+        return SimulatedBrowser(self)
+
+
+def create_backend(browser_type: str, headless: bool, sim_solve_time: str = 'lognormal:2,0.5', sim_fail_rate: float = 0.0,
+                   sim_crash_rate: float = 0.0) -> BrowserBackend:
+    """Backend for a --browser_type value."""
+    if browser_type in CHROMIUM_CHANNELS:
+        return ChromiumBackend(browser_type, headless)
+    if browser_type == 'camoufox':
+        return CamoufoxBackend(headless)
+    if browser_type == 'simulated':
+        return SimulatedBackend(sim_solve_time, sim_fail_rate, sim_crash_rate)
+    raise ValueError(f"Unknown browser type: {browser_type}")
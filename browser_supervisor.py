@@ -0,0 +1,395 @@
+import os
+import time
+import asyncio
+import logging
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+import psutil
+
+
+# Seconds between supervisor passes over the pool
+CHECK_INTERVAL = 5
+# Idle browsers not used for this long get a liveness probe
+PROBE_INTERVAL = 30
+PROBE_TIMEOUT = 10
+# Delay before retrying a failed relaunch, doubled per failure up to the maximum
+RESTART_BACKOFF = 5
+MAX_RESTART_BACKOFF = 120
+# Seconds between RSS measurements of the browser process trees
+RSS_INTERVAL = 30
+
+
+def _logger() -> logging.Logger:
+    # Looked up lazily: api_solver registers its CustomLogger class after importing this module
+    return logging.getLogger("TurnstileAPIServer")
+
+
+class SlotState(Enum):
+    IDLE = "idle"
+    BUSY = "busy"
+    RESTARTING = "restarting"
+    RECYCLING = "recycling"
+    DEAD = "dead"
+
+
+class RecyclePolicy:
+    """Limits after which a healthy browser is replaced by a fresh one; 0 disables a limit."""
+
+    def __init__(self, max_solves: int = 0, max_age: float = 0, max_rss_mb: float = 0):
+        self.max_solves = max_solves
+        self.max_age = max_age
+        self.max_rss_mb = max_rss_mb
+
+    def reason(self, slot: "BrowserSlot") -> Optional[str]:
+        if self.max_solves and slot.solves >= self.max_solves:
+            return f"{slot.solves} solves"
+        if self.max_age and time.time() - slot.launched_at >= self.max_age:
+            return f"age {int(time.time() - slot.launched_at)}s"
+        if self.max_rss_mb and slot.rss_mb and slot.rss_mb >= self.max_rss_mb:
+            return f"RSS {slot.rss_mb:.0f}MB"
+        return None
+
+
+class BrowserSlot:
+    __slots__ = ("index", "config", "browser", "pids", "state", "restarts", "recycles", "failures", "last_error",
+                 "retry_at", "checked_at", "launched_at", "solves", "rss_mb")
+
+    def __init__(self, index: int, config: dict, browser, pids=()):
+        self.index = index
+        self.config = config
+        self.state = SlotState.IDLE
+        self.restarts = 0
+        self.recycles = 0
+        self.failures = 0
+        self.last_error = None
+        self.retry_at = 0.0
+        self.rss_mb = None
+        self.replace(browser, pids)
+
+    def replace(self, browser, pids) -> None:
+        self.browser = browser
+        self.pids = pids  # root pids of the browser process tree
+        self.launched_at = self.checked_at = time.time()
+        self.solves = 0
+
+    def stats(self) -> dict:
+        return {
+            "index": self.index,
+            "state": self.state.value,
+            "restarts": self.restarts,
+            "recycles": self.recycles,
+            "solves": self.solves,
+            "age": int(time.time() - self.launched_at),
+            "rss_mb": round(self.rss_mb, 1) if self.rss_mb is not None else None,
+            "last_error": self.last_error,
+            "browser_name": self.config.get('browser_name'),
+            "browser_version": self.config.get('browser_version')
+        }
+
+
+def _connected(browser) -> bool:
+    try:
+        return not hasattr(browser, 'is_connected') or browser.is_connected()
+    except Exception:
+        return False
+
+
+def _descendants() -> set:
+    try:
+        return {child.pid for child in psutil.Process(os.getpid()).children(recursive=True)}
+    except psutil.Error:
+        return set()
+
+
+def _tree_pids(pids) -> set:
+    """The given processes and all their children that are still running."""
+    tree = set()
+    for pid in pids:
+        try:
+            root = psutil.Process(pid)
+            tree.add(pid)
+            tree.update(child.pid for child in root.children(recursive=True))
+        except psutil.Error:
+            pass
+    return tree
+
+
+def _tree_rss_mb(pids) -> Optional[float]:
+    """Resident memory of the given processes and all their children."""
+    total = 0
+    found = False
+    for pid in pids:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            continue
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+                found = True
+            except psutil.Error:
+                pass
+    return total / 2**20 if found else None
+
+
+class BrowserSupervisor:
+    """Tracks every browser slot of the pool and relaunches the ones that die.
+
+    Slots go back into ``pool`` as ``(index, browser, config)`` tuples. A tuple
+    whose browser has since been replaced is stale and skipped on acquire, so
+    a dead browser never has to be fished out of the queue.
+
+    Healthy browsers past a ``RecyclePolicy`` limit are taken out of service
+    when idle, replaced by a freshly launched browser and closed. Only one
+    slot recycles at a time and only while no other slot is down, so the pool
+    keeps at least N-1 browsers serving.
+    """
+
+    def __init__(self, pool: asyncio.Queue, launch: Callable[[int, dict], Awaitable], discard: Callable[[int], None],
+                 recycle: Optional[RecyclePolicy] = None, debug: bool = False):
+        self.pool = pool
+        self.launch = launch    # launch(index, config) -> new browser, ready to be used
+        self.discard = discard  # discard(index) drops state kept for the old browser
+        self.recycle = recycle or RecyclePolicy()
+        self.debug = debug
+        self.slots = {}
+        self._tasks = set()
+        self._launch_lock = asyncio.Lock()
+        self._rss_checked_at = 0.0
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _launch(self, index: int, config: dict):
+        """Launch a browser and find the processes it started.
+
+        Launches are serialised so the new processes can be told apart, but
+        running browsers keep starting renderers meanwhile: processes in the
+        tree of an existing slot are not counted as the new browser's.
+        """
+        async with self._launch_lock:
+            before = _descendants()
+            browser = await self.launch(index, config)
+            started = _descendants() - before
+            started -= _tree_pids(pid for slot in self.slots.values() for pid in slot.pids)
+        roots = []
+        for pid in started:
+            try:
+                if psutil.Process(pid).ppid() not in started:
+                    roots.append(pid)
+            except psutil.Error:
+                pass
+        return browser, tuple(roots)
+
+    async def start(self, index: int, config: dict) -> bool:
+        """Launch the browser of a new slot and put it into the pool."""
+        browser, pids = await self._launch(index, config)
+        if not browser:
+            return False
+        self.slots[index] = BrowserSlot(index, config, browser, pids)
+        self._watch(index, browser)
+        self.pool.put_nowait((index, browser, config))
+        return True
+
+    def _watch(self, index: int, browser) -> None:
+        if hasattr(browser, 'on'):
+            browser.on("disconnected", lambda *_: self.mark_dead(index, browser, "disconnected"))
+
+    def _take(self, entry) -> bool:
+        """Claim a pool entry if it is still the live browser of its slot."""
+        index, browser, _ = entry
+        slot = self.slots.get(index)
+        if slot is None or slot.browser is not browser or slot.state is not SlotState.IDLE:
+            return False
+        if not _connected(browser):
+            self.mark_dead(index, browser, "disconnected")
+            return False
+        slot.state = SlotState.BUSY
+        return True
+
+    async def acquire(self):
+        """Wait for a live idle browser."""
+        while True:
+            entry = await self.pool.get()
+            if self._take(entry):
+                return entry
+
+    def try_acquire(self, reserve: int = 0):
+        """Take a live idle browser without waiting, keeping ``reserve`` of them free."""
+        while self.idle_count() > reserve:
+            try:
+                entry = self.pool.get_nowait()
+            except asyncio.QueueEmpty:
+                return None
+            if self._take(entry):
+                return entry
+        return None
+
+    async def retire(self) -> bool:
+        """Permanently remove one idle browser from the pool, newest slot first."""
+        idle = [slot for slot in self.slots.values() if slot.state is SlotState.IDLE]
+        if not idle:
+            return False
+        slot = max(idle, key=lambda slot: slot.index)
+        # Its pool entry becomes stale once the slot is gone
+        del self.slots[slot.index]
+        self.discard(slot.index)
+        try:
+            await slot.browser.close()
+        except Exception:
+            pass
+        return True
+
+    def release(self, index: int, browser, solved: bool = True) -> None:
+        """Return a browser after use, or have it relaunched if it died or is due for recycling."""
+        slot = self.slots.get(index)
+        if slot is None or slot.browser is not browser or slot.state is not SlotState.BUSY:
+            return
+        if not _connected(browser):
+            self.mark_dead(index, browser, "disconnected")
+            return
+        if solved:
+            slot.solves += 1
+        slot.state = SlotState.IDLE
+        slot.checked_at = time.time()
+        if self._start_recycle(slot):
+            return
+        self.pool.put_nowait((index, browser, slot.config))
+
+    def _start_recycle(self, slot: BrowserSlot) -> bool:
+        """Take an idle slot out of service for recycling if it is due and capacity allows."""
+        reason = self.recycle.reason(slot)
+        if reason is None:
+            return False
+        if any(other.state not in (SlotState.IDLE, SlotState.BUSY) for other in self.slots.values() if other is not slot):
+            return False  # another slot is already down; keep N-1 serving
+        # Its pool entry, if any, is now stale: only idle slots can be acquired
+        slot.state = SlotState.RECYCLING
+        self._spawn(self._recycle(slot, reason))
+        return True
+
+    async def _recycle(self, slot: BrowserSlot, reason: str) -> None:
+        if self.debug:
+            _logger().debug(f"Browser {slot.index}: Recycling after {reason}")
+        old = slot.browser
+        # Warm contexts are per slot index; the launcher prewarms the new browser under the same index
+        self.discard(slot.index)
+        try:
+            browser, pids = await self._launch(slot.index, slot.config)
+            if not browser:
+                raise RuntimeError("launcher returned no browser")
+        except Exception as e:
+            _logger().error(f"Browser {slot.index}: Recycle launch failed, keeping the old browser: {str(e)}")
+            slot.state = SlotState.IDLE
+            slot.launched_at = time.time()  # do not retry on every release
+            slot.solves = 0
+            self.pool.put_nowait((slot.index, old, slot.config))
+            return
+
+        slot.replace(browser, pids)
+        slot.rss_mb = None
+        slot.recycles += 1
+        slot.state = SlotState.IDLE
+        self._watch(slot.index, browser)
+        self.pool.put_nowait((slot.index, browser, slot.config))
+        try:
+            await old.close()
+        except Exception:
+            pass
+        _logger().info(f"Browser {slot.index}: Recycled after {reason} (recycle #{slot.recycles})")
+
+    def mark_dead(self, index: int, browser, reason: str) -> None:
+        slot = self.slots.get(index)
+        if slot is None or slot.browser is not browser or slot.state in (SlotState.RESTARTING, SlotState.DEAD):
+            return
+        _logger().warning(f"Browser {index}: {reason}, relaunching")
+        slot.state = SlotState.DEAD
+        slot.last_error = reason
+        slot.retry_at = 0.0
+        self._spawn(self._restart(slot))
+
+    async def _restart(self, slot: BrowserSlot) -> None:
+        if slot.state is not SlotState.DEAD:
+            return
+        slot.state = SlotState.RESTARTING
+        old = slot.browser
+        self.discard(slot.index)
+        try:
+            await old.close()
+        except Exception:
+            pass
+
+        try:
+            browser, pids = await self._launch(slot.index, slot.config)
+            if not browser:
+                raise RuntimeError("launcher returned no browser")
+        except Exception as e:
+            slot.failures += 1
+            slot.state = SlotState.DEAD
+            slot.last_error = f"relaunch failed: {str(e)}"
+            slot.retry_at = time.time() + min(RESTART_BACKOFF * 2 ** (slot.failures - 1), MAX_RESTART_BACKOFF)
+            _logger().error(f"Browser {slot.index}: Relaunch failed: {str(e)}")
+            return
+
+        slot.replace(browser, pids)
+        slot.rss_mb = None
+        slot.restarts += 1
+        slot.failures = 0
+        slot.state = SlotState.IDLE
+        self._watch(slot.index, browser)
+        self.pool.put_nowait((slot.index, browser, slot.config))
+        _logger().info(f"Browser {slot.index}: Relaunched (restart #{slot.restarts})")
+
+    async def _probe(self, slot: BrowserSlot) -> None:
+        browser = slot.browser
+        try:
+            context = await asyncio.wait_for(browser.new_context(), timeout=PROBE_TIMEOUT)
+            await context.close()
+        except Exception as e:
+            self.mark_dead(slot.index, browser, f"liveness probe failed: {str(e) or type(e).__name__}")
+
+    def _measure_rss(self) -> None:
+        for slot in self.slots.values():
+            if slot.state in (SlotState.IDLE, SlotState.BUSY) and slot.pids:
+                slot.rss_mb = _tree_rss_mb(slot.pids)
+
+    async def run(self) -> None:
+        """Periodically probe idle browsers, recycle worn ones and retry failed relaunches."""
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            now = time.time()
+            if now - self._rss_checked_at >= RSS_INTERVAL:
+                self._rss_checked_at = now
+                await asyncio.get_running_loop().run_in_executor(None, self._measure_rss)
+            for slot in list(self.slots.values()):
+                try:
+                    if slot.state is SlotState.DEAD and now >= slot.retry_at:
+                        self._spawn(self._restart(slot))
+                    elif slot.state is SlotState.IDLE:
+                        if not _connected(slot.browser):
+                            self.mark_dead(slot.index, slot.browser, "disconnected")
+                        elif self._start_recycle(slot):
+                            pass
+                        elif now - slot.checked_at >= PROBE_INTERVAL:
+                            slot.checked_at = now
+                            self._spawn(self._probe(slot))
+                except Exception as e:
+                    _logger().error(f"Browser {slot.index}: Supervisor check failed: {str(e)}")
+
+    def idle_count(self) -> int:
+        return sum(1 for slot in self.slots.values() if slot.state is SlotState.IDLE)
+
+    def stats(self) -> dict:
+        states = {state.value: 0 for state in SlotState}
+        for slot in self.slots.values():
+            states[slot.state.value] += 1
+        return {
+            "states": states,
+            "restarts": sum(slot.restarts for slot in self.slots.values()),
+            "recycles": sum(slot.recycles for slot in self.slots.values()),
+            "slots": [slot.stats() for slot in sorted(self.slots.values(), key=lambda slot: slot.index)]
+        }
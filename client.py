@@ -5,8 +5,14 @@ Turnstile Solver 客户端库
 """
 
 import time
+import asyncio
 import requests
-from typing import Optional
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import aiohttp
+except ImportError:  # 只有 AsyncTurnstileSolver 需要 aiohttp
+    aiohttp = None
 
 
 class TurnstileSolver:
@@ -21,8 +27,9 @@ class TurnstileSolver:
         )
     """
     
-    def __init__(self, server_url: str = "http://127.0.0.1:5072"):
+    def __init__(self, server_url: str = "http://127.0.0.1:5072", long_poll_wait: float = 20):
         self.server_url = server_url.rstrip('/')
+        self.long_poll_wait = long_poll_wait  # 长轮询等待秒数，0 表示普通轮询
     
     def create_task(self, url: str, sitekey: str) -> str:
         """创建 Turnstile 解决任务"""
@@ -42,16 +49,54 @@ class TurnstileSolver:
         
         return data['taskId']
     
-    def get_result(self, task_id: str) -> dict:
-        """获取任务结果"""
+    def get_result(self, task_id: str, wait: float = 0) -> dict:
+        """获取任务结果，wait > 0 时服务端最多等待 wait 秒 (长轮询)"""
         resp = requests.post(
             f"{self.server_url}/getTaskResult",
-            json={"taskId": task_id},
-            timeout=10
+            json={"taskId": task_id, "wait": wait},
+            timeout=10 + wait
         )
         resp.raise_for_status()
         return resp.json()
     
+    def create_tasks(self, tasks: List[dict]) -> List[Optional[str]]:
+        """
+        批量创建任务 (POST /createTasks)
+        
+        Args:
+            tasks: [{"url": ..., "sitekey": ..., "action": ..., "cdata": ...}, ...]
+        
+        Returns:
+            与 tasks 一一对应的 taskId 列表，被拒绝的任务 (如队列已满) 为 None
+        """
+        resp = requests.post(
+            f"{self.server_url}/createTasks",
+            json={"tasks": tasks},
+            timeout=30
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        
+        if 'tasks' not in data:
+            raise Exception(f"Create tasks failed: {data.get('errorDescription') or data.get('errorCode')}")
+        
+        return [item.get('taskId') for item in data['tasks']]
+    
+    def get_results(self, task_ids: List[str], wait: float = 0) -> Dict[str, dict]:
+        """批量获取任务结果 (POST /getTaskResults)，wait > 0 时等待全部完成或超时"""
+        resp = requests.post(
+            f"{self.server_url}/getTaskResults",
+            json={"taskIds": task_ids, "wait": wait},
+            timeout=30 + wait
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        
+        if 'results' not in data:
+            raise Exception(f"Get results failed: {data.get('errorDescription') or data.get('errorCode')}")
+        
+        return data['results']
+    
     def solve(self, url: str, sitekey: str, timeout: int = 60, poll_interval: float = 2) -> Optional[str]:
         """
         解决 Turnstile 验证码
@@ -60,7 +105,7 @@ class TurnstileSolver:
             url: 网站 URL
             sitekey: Turnstile site key
             timeout: 超时时间(秒)
-            poll_interval: 轮询间隔(秒)
+            poll_interval: 服务端不支持长轮询时的轮询间隔(秒)
         
         Returns:
             Turnstile token 或 None
@@ -74,7 +119,9 @@ class TurnstileSolver:
         # 等待结果
         start_time = time.time()
         while time.time() - start_time < timeout:
-            result = self.get_result(task_id)
+            wait = min(self.long_poll_wait, max(timeout - (time.time() - start_time), 0))
+            polled_at = time.time()
+            result = self.get_result(task_id, wait=wait)
             status = result.get('status')
             
             if status == 'ready':
@@ -84,7 +131,9 @@ class TurnstileSolver:
                 error = result.get('error', 'Unknown error')
                 raise Exception(f"Turnstile solve failed: {error}")
             
-            time.sleep(poll_interval)
+            # 只有长轮询确实挂起了请求才跳过等待；普通轮询或服务端立即返回 (不支持长轮询) 时定时轮询
+            if not wait or time.time() - polled_at < min(wait, poll_interval):
+                time.sleep(poll_interval)
         
         raise Exception(f"Turnstile solve timeout ({timeout}s)")
     
@@ -95,12 +144,199 @@ class TurnstileSolver:
         return resp.json()
 
 
+class AsyncTurnstileSolver:
+    """
+    异步 Turnstile Solver 客户端 (需要 aiohttp)
+    
+    所有请求共用一个 keep-alive 连接池，适合在 asyncio 爬虫中同时解决大量验证码。
+    使用 GET /turnstile 和 GET /result，api_solver.py 和 solver.py 都支持。
+    
+    示例:
+        async with AsyncTurnstileSolver("http://127.0.0.1:5072") as solver:
+            token = await solver.solve("https://example.com", "0x4AAAAAAxxxxxx")
+            
+            tasks = [{"url": "https://example.com", "sitekey": "0x4AAAAAAxxxxxx"}] * 100
+            async for index, token, error in solver.solve_many(tasks, concurrency=50):
+                print(index, token or error)
+    """
+    
+    def __init__(self, server_url: str = "http://127.0.0.1:5072", long_poll_wait: float = 20, api_key: Optional[str] = None,
+                 max_connections: int = 100):
+        if aiohttp is None:
+            raise ImportError("AsyncTurnstileSolver 需要 aiohttp: pip install aiohttp")
+        self.server_url = server_url.rstrip('/')
+        self.long_poll_wait = long_poll_wait  # 长轮询等待秒数，0 表示普通轮询
+        self.api_key = api_key
+        self.max_connections = max_connections  # 连接池大小，即同时进行的 HTTP 请求上限
+        self._session = None
+        self._long_poll = None  # 服务端是否支持长轮询，None 表示还不知道
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.close()
+    
+    def _get_session(self):
+        # 在事件循环内第一次请求时才创建 session
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                headers={"X-API-Key": self.api_key} if self.api_key else None
+            )
+        return self._session
+    
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    async def _get(self, path: str, params: dict, timeout: float) -> Tuple[int, dict]:
+        async with self._get_session().get(
+            f"{self.server_url}{path}",
+            params=params,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            if resp.status >= 500:
+                resp.raise_for_status()
+            return resp.status, await resp.json(content_type=None)
+    
+    async def create_task(self, url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None,
+                          timeout: float = 0) -> str:
+        """创建 Turnstile 解决任务，队列已满 (HTTP 429) 时在 timeout 秒内按 Retry-After 重试"""
+        params = {"url": url, "sitekey": sitekey}
+        if action:
+            params["action"] = action
+        if cdata:
+            params["cdata"] = cdata
+        
+        deadline = time.monotonic() + timeout
+        while True:
+            status, data = await self._get("/turnstile", params, 10)
+            if data.get('taskId'):
+                return data['taskId']
+            
+            remaining = deadline - time.monotonic()
+            if (status == 429 or data.get('errorCode') == 'ERROR_NO_SLOT_AVAILABLE') and remaining > 0:
+                await asyncio.sleep(min(float(data.get('retryAfter') or 1), remaining))
+                continue
+            raise Exception(f"Create task failed: {data.get('errorDescription') or data.get('errorCode') or data.get('error')}")
+    
+    async def get_result(self, task_id: str, wait: float = 0) -> dict:
+        """获取任务结果，wait > 0 时服务端最多等待 wait 秒 (长轮询)"""
+        _, data = await self._get("/result", {"id": task_id, "wait": wait}, 10 + wait)
+        return data
+    
+    @staticmethod
+    def _parse_result(data: dict) -> Tuple[Optional[str], Optional[str]]:
+        """(token, 错误信息)，都为 None 表示任务还在处理中"""
+        token = (data.get('solution') or {}).get('token')
+        if token and token != 'CAPTCHA_FAIL':
+            return token, None
+        if token == 'CAPTCHA_FAIL' or data.get('errorId') == 1 or data.get('error'):
+            return None, data.get('errorDescription') or data.get('errorCode') or data.get('error') or 'CAPTCHA_FAIL'
+        return None, None
+    
+    async def solve(self, url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None,
+                    timeout: float = 60, poll_interval: float = 2) -> str:
+        """
+        解决 Turnstile 验证码
+        
+        服务端支持长轮询时每次请求挂起等待结果；不支持时改为定时轮询，
+        间隔从 0.5 秒逐渐增加到 poll_interval 秒。
+        
+        Args:
+            url: 网站 URL
+            sitekey: Turnstile site key
+            action: 可选 action
+            cdata: 可选 cdata
+            timeout: 超时时间(秒)，包括队列已满时的重试
+            poll_interval: 定时轮询的最大间隔(秒)
+        
+        Returns:
+            Turnstile token
+        
+        Raises:
+            Exception: 解决失败或超时时抛出异常
+        """
+        deadline = time.monotonic() + timeout
+        task_id = await self.create_task(url, sitekey, action, cdata, timeout=timeout)
+        
+        delay = min(0.5, poll_interval)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception(f"Turnstile solve timeout ({timeout}s)")
+            
+            wait = min(self.long_poll_wait, remaining) if self._long_poll is not False else 0
+            polled_at = time.monotonic()
+            token, error = self._parse_result(await self.get_result(task_id, wait=wait))
+            if token:
+                return token
+            if error:
+                raise Exception(f"Turnstile solve failed: {error}")
+            
+            if wait:
+                if time.monotonic() - polled_at >= min(wait, 1):
+                    self._long_poll = True
+                    continue
+                # 服务端立即返回说明不支持长轮询，之后都改为定时轮询
+                if self._long_poll is None:
+                    self._long_poll = False
+            
+            await asyncio.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 1.5, poll_interval)
+    
+    async def solve_many(self, tasks: Iterable[dict], concurrency: int = 10, timeout: float = 60) -> AsyncIterator[Tuple[int, Optional[str], Optional[str]]]:
+        """
+        并发解决多个验证码，按完成顺序逐个返回结果
+        
+        Args:
+            tasks: [{"url": ..., "sitekey": ..., "action": ..., "cdata": ...}, ...]，可以是生成器
+            concurrency: 同时进行的任务数
+            timeout: 每个任务的超时时间(秒)
+        
+        Yields:
+            (tasks 中的序号, token, 错误信息)，成功时错误信息为 None，失败时 token 为 None
+        """
+        async def run(index: int, task: dict):
+            try:
+                token = await self.solve(task['url'], task['sitekey'], task.get('action'), task.get('cdata'), timeout=timeout)
+                return index, token, None
+            except Exception as e:
+                return index, None, str(e) or type(e).__name__
+        
+        pending = set()
+        try:
+            for index, task in enumerate(tasks):
+                pending.add(asyncio.ensure_future(run(index, task)))
+                if len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # 调用方提前停止迭代时取消剩余任务
+            for future in pending:
+                future.cancel()
+    
+    async def health(self) -> dict:
+        """检查服务健康状态"""
+        _, data = await self._get("/health", {}, 5)
+        return data
+
+
 # 兼容旧版 API 的客户端
 class TurnstileSolverLegacy:
     """旧版 API 客户端 (兼容 grok 项目)"""
     
-    def __init__(self, server_url: str = "http://127.0.0.1:5072"):
+    def __init__(self, server_url: str = "http://127.0.0.1:5072", long_poll_wait: float = 20):
         self.server_url = server_url.rstrip('/')
+        self.long_poll_wait = long_poll_wait
     
     def create_task(self, url: str, sitekey: str) -> str:
         resp = requests.get(
@@ -111,15 +347,16 @@ class TurnstileSolverLegacy:
         resp.raise_for_status()
         return resp.json()['taskId']
     
-    def get_response(self, task_id: str, max_retries: int = 30, initial_delay: float = 5, retry_delay: float = 2) -> Optional[str]:
+    def get_response(self, task_id: str, max_retries: int = 30, initial_delay: float = 0, retry_delay: float = 2) -> Optional[str]:
         time.sleep(initial_delay)
         
         for _ in range(max_retries):
+            polled_at = time.time()
             try:
                 resp = requests.get(
                     f"{self.server_url}/result",
-                    params={"id": task_id},
-                    timeout=10
+                    params={"id": task_id, "wait": self.long_poll_wait},
+                    timeout=10 + self.long_poll_wait
                 )
                 resp.raise_for_status()
                 data = resp.json()
@@ -127,10 +364,12 @@ class TurnstileSolverLegacy:
                 
                 if token and token != 'CAPTCHA_FAIL':
                     return token
-                elif token == 'CAPTCHA_FAIL':
+                elif token == 'CAPTCHA_FAIL' or data.get('errorId') == 1:
                     return None
                 
-                time.sleep(retry_delay)
+                # 只有长轮询确实挂起了请求才跳过等待；普通轮询或服务端立即返回 (不支持长轮询) 时定时轮询
+                if not self.long_poll_wait or time.time() - polled_at < min(self.long_poll_wait, retry_delay):
+                    time.sleep(retry_delay)
             except Exception as e:
                 time.sleep(retry_delay)
         
@@ -0,0 +1,213 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional, Tuple
+
+
+def _logger() -> logging.Logger:
+    # Looked up lazily: api_solver registers its CustomLogger class after importing this module
+    return logging.getLogger("TurnstileAPIServer")
+
+ContextKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+class ReusePolicy:
+    """How long a context may keep serving solves; ``max_uses=1`` gives every task a fresh context."""
+
+    def __init__(self, max_uses: int = 1, max_age: float = 300, keep_cookies: bool = False, keep_storage: bool = False):
+        self.max_uses = max(1, max_uses)
+        self.max_age = max_age
+        self.keep_cookies = keep_cookies
+        self.keep_storage = keep_storage
+
+    def allows(self, uses: int, created_at: float) -> bool:
+        if uses >= self.max_uses:
+            return False
+        return not self.max_age or time.time() - created_at < self.max_age
+
+
+class WarmContextPool:
+    """Ready-to-use (context, page) pairs per browser.
+
+    Contexts are keyed by (proxy, useragent, sec_ch_ua) so a task only gets a
+    context whose network identity matches what it asked for. Each browser
+    keeps at most ``size`` ready contexts; the least recently requested key is
+    evicted first. A used context goes back to the pool after ``reset`` while
+    the reuse policy allows it, so the next solve through the same proxy keeps
+    its open connections and HTTP cache; otherwise it is closed and replaced
+    in the background.
+    """
+
+    def __init__(self, size: int, factory: Callable[..., Awaitable[tuple]], reset: Optional[Callable[..., Awaitable[None]]] = None,
+                 policy: Optional[ReusePolicy] = None, debug: bool = False):
+        self.size = size
+        self.factory = factory  # factory(index, browser, browser_config, proxy) -> (context, page)
+        self.reset = reset      # reset(index, context, page, keep_cookies, keep_storage) before a context is reused
+        self.policy = policy or ReusePolicy()
+        self.debug = debug
+        self._ready = {}    # index -> OrderedDict[key, deque[(context, page)]]
+        self._pending = {}  # index -> {key: number of contexts being prepared}
+        self._uses = {}     # context -> [solves served, created at]
+        self._resetting = {}  # context -> task resetting it for its next solve
+        self._tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+
+    @staticmethod
+    def key(browser_config: dict, proxy: Optional[str]) -> ContextKey:
+        return proxy, browser_config.get('useragent'), browser_config.get('sec_ch_ua')
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _count(self, index: int) -> int:
+        ready = sum(len(entries) for entries in self._ready.get(index, {}).values())
+        return ready + sum(self._pending.get(index, {}).values())
+
+    async def checkout(self, index: int, browser, browser_config: dict, proxy: Optional[str] = None):
+        """Return a ready (context, page, warm), preparing one inline if none is warm.
+
+        ``warm`` is True when the context came from the pool.
+        """
+        key = self.key(browser_config, proxy)
+        entries = self._ready.get(index, {}).get(key)
+        while entries:
+            context, page = entries.popleft()
+            resetting = self._resetting.pop(context, None)
+            if resetting and not await resetting:
+                continue
+            if not page.is_closed():
+                self.hits += 1
+                self._uses.setdefault(context, [0, time.time()])[0] += 1
+                return context, page, True
+            self._spawn(self._close(index, context))
+
+        self.misses += 1
+        context, page = await self.factory(index, browser, browser_config, proxy)
+        self._uses[context] = [1, time.time()]
+        return context, page, False
+
+    def release(self, index: int, browser, browser_config: dict, proxy: Optional[str], context, page=None,
+                used_proxy: Optional[str] = None, reusable: bool = False) -> None:
+        """Reuse or destroy a used context and warm one for ``proxy``, both off the request path.
+
+        ``used_proxy`` is the proxy the context was created with; ``reusable``
+        is False after a failed solve so a possibly flagged context is dropped.
+        A reused context is ready at once; ``checkout`` waits for its reset.
+        """
+        if context is not None:
+            if reusable and page is not None and self._reusable(browser, context, page) and self._store(index, browser_config, used_proxy, context, page):
+                self._resetting[context] = self._spawn(self._reset(index, context, page))
+                self.reused += 1
+            else:
+                self._spawn(self._close(index, context))
+        if self.size > 0:
+            self._spawn(self.prewarm(index, browser, browser_config, proxy))
+
+    def _reusable(self, browser, context, page) -> bool:
+        uses = self._uses.get(context)
+        if not uses or not self.policy.allows(*uses) or page.is_closed():
+            return False
+        return not hasattr(browser, 'is_connected') or browser.is_connected()
+
+    def _store(self, index: int, browser_config: dict, proxy: Optional[str], context, page) -> bool:
+        """Put a used context back in the ready set of its key if there is room."""
+        if self._count(index) >= max(self.size, 1) and not self._evict_one(index):
+            return False
+        ready = self._ready.setdefault(index, OrderedDict())
+        key = self.key(browser_config, proxy)
+        ready.setdefault(key, deque()).append((context, page))
+        ready.move_to_end(key)
+        return True
+
+    async def _reset(self, index: int, context, page) -> bool:
+        try:
+            if self.reset:
+                await self.reset(index, context, page, self.policy.keep_cookies, self.policy.keep_storage)
+            return True
+        except Exception as e:
+            if self.debug:
+                _logger().warning(f"Browser {index}: Failed to reset context for reuse: {str(e)}")
+            await self._close(index, context)
+            return False
+
+    async def prewarm(self, index: int, browser, browser_config: dict, proxy: Optional[str] = None) -> None:
+        """Prepare one context for ``key`` unless this browser already has one ready."""
+        key = self.key(browser_config, proxy)
+        ready = self._ready.setdefault(index, OrderedDict())
+        pending = self._pending.setdefault(index, {})
+        if ready.get(key) or pending.get(key):
+            if key in ready:
+                ready.move_to_end(key)
+            return
+        if hasattr(browser, 'is_connected') and not browser.is_connected():
+            return
+
+        if self._count(index) >= self.size and not self._evict_one(index):
+            return  # every slot is still being prepared
+
+        pending[key] = pending.get(key, 0) + 1
+        try:
+            context, page = await self.factory(index, browser, browser_config, proxy)
+        except Exception as e:
+            if self.debug:
+                _logger().warning(f"Browser {index}: Failed to prewarm context: {str(e)}")
+            return
+        finally:
+            pending[key] -= 1
+            if not pending[key]:
+                del pending[key]
+
+        if self._ready.get(index) is not ready:
+            # Browser was discarded while this context was being prepared
+            await self._close(index, context)
+            return
+        self._uses[context] = [0, time.time()]
+        ready.setdefault(key, deque()).append((context, page))
+        ready.move_to_end(key)
+
+    def _evict_one(self, index: int) -> bool:
+        """Close the oldest ready context of the least recently used key."""
+        ready = self._ready.get(index)
+        while ready:
+            key, entries = next(iter(ready.items()))
+            if not entries:
+                del ready[key]
+                continue
+            context, _ = entries.popleft()
+            if not entries:
+                del ready[key]
+            self._spawn(self._close(index, context))
+            return True
+        return False
+
+    def discard_browser(self, index: int) -> None:
+        """Forget and close every ready context of a browser."""
+        self._pending.pop(index, None)
+        for entries in self._ready.pop(index, {}).values():
+            for context, _ in entries:
+                self._spawn(self._close(index, context))
+
+    async def _close(self, index: int, context) -> None:
+        self._uses.pop(context, None)
+        self._resetting.pop(context, None)
+        try:
+            await context.close()
+        except Exception as e:
+            if self.debug:
+                _logger().warning(f"Browser {index}: Error closing context: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "ready": sum(len(entries) for ready in self._ready.values() for entries in ready.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused": self.reused,
+            "max_uses": self.policy.max_uses
+        }
@@ -1,27 +1,368 @@
-import time
-import asyncio
-
-# 内存数据库，用于临时存储验证码结果
-results_db = {}
-
-async def init_db():
-    print("[系统] 结果数据库初始化成功 (内存模式)")
-
-async def save_result(task_id, task_type, data):
-    # 存储结果，如果 data 是字典则存入，否则构造字典
-    results_db[task_id] = data
-    print(f"[系统] 任务 {task_id} 状态更新: {data.get('value', '正在处理')}")
-
-async def load_result(task_id):
-    return results_db.get(task_id)
-
-async def cleanup_old_results(days_old=7):
-    # 简单的清理逻辑
-    now = time.time()
-    to_delete = []
-    for tid, res in results_db.items():
-        if isinstance(res, dict) and now - res.get('createTime', now) > days_old * 86400:
-            to_delete.append(tid)
-    for tid in to_delete:
-        del results_db[tid]
-    return len(to_delete)
\ No newline at end of file
+import sys
+import json
+import time
+import heapq
+import sqlite3
+import asyncio
+from enum import Enum
+from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+class TaskStatus(Enum):
+    PENDING = "CAPTCHA_NOT_READY"
+    READY = "ready"
+    FAILED = "CAPTCHA_FAIL"
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class TaskRecord:
+    """单个任务的状态和结果
+
+    使用 __slots__ 避免每条记录一个 dict；url/sitekey 等重复出现的字符串做了驻留，
+    同一站点的大量任务共享同一份字符串。
+    """
+    status: TaskStatus = TaskStatus.PENDING
+    create_time: float = field(default_factory=time.time)
+    url: Optional[str] = None
+    sitekey: Optional[str] = None
+    action: Optional[str] = None
+    cdata: Optional[str] = None
+    token: Optional[str] = None
+    elapsed_time: Optional[float] = None
+    error_code: Optional[str] = None
+    trace: Optional[dict] = None  # 各阶段耗时，见 task_trace.TaskTrace
+
+    @classmethod
+    def pending(cls, url, sitekey, action=None, cdata=None):
+        return cls(url=_intern(url), sitekey=_intern(sitekey), action=_intern(action), cdata=_intern(cdata))
+
+    @classmethod
+    def finished(cls, token, elapsed_time, error_code=None):
+        record = cls()
+        record.finish(token, elapsed_time, error_code)
+        return record
+
+    def finish(self, token, elapsed_time, error_code=None):
+        self.status = TaskStatus.READY if token else TaskStatus.FAILED
+        self.token = token or None
+        self.elapsed_time = elapsed_time
+        self.error_code = _intern(error_code)
+
+    @property
+    def is_final(self):
+        return self.status is not TaskStatus.PENDING
+
+    def to_dict(self):
+        # 与旧版字典格式一致，SQLite 中的历史记录仍可读取
+        if not self.is_final:
+            return {"status": self.status.value, "createTime": self.create_time, "url": self.url,
+                    "sitekey": self.sitekey, "action": self.action, "cdata": self.cdata}
+        data = {"value": self.token or TaskStatus.FAILED.value, "elapsed_time": self.elapsed_time, "createTime": self.create_time}
+        if self.error_code:
+            data["errorCode"] = self.error_code
+        if self.trace:
+            data["trace"] = self.trace
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(create_time=data.get("createTime") or time.time(), url=_intern(data.get("url")),
+                     sitekey=_intern(data.get("sitekey")), action=_intern(data.get("action")), cdata=_intern(data.get("cdata")))
+        if "value" in data:
+            value = data["value"]
+            record.finish(value if value != TaskStatus.FAILED.value else None, data.get("elapsed_time"), data.get("errorCode"))
+            record.trace = data.get("trace")
+        return record
+
+
+# SQLite 存储精确统计行数的最长间隔 (秒)
+ROW_RECOUNT_INTERVAL = 600
+
+
+class ResultTTL:
+    """结果保留策略
+
+    task: 未完成任务的最长保留时间
+    token: 完成结果的保留时间 (Turnstile token 约 300 秒后失效)
+    consumed: 完成结果被客户端取走后的剩余保留时间，留给重试
+    max_entries: 最多保留的条目数
+    """
+
+    def __init__(self, task=600, token=300, consumed=30, max_entries=100000):
+        self.task = task
+        self.token = token
+        self.consumed = consumed
+        self.max_entries = max_entries
+
+    def for_record(self, record):
+        return self.token if record.is_final else self.task
+
+
+class MemoryStore:
+    """内存存储，进程退出后结果丢失
+
+    每条记录按过期时间进入最小堆，清理只弹出已过期的记录；
+    条目数超过上限时按最近最少使用淘汰。
+    """
+
+    def __init__(self, ttl: ResultTTL):
+        self.ttl = ttl
+        self.results = OrderedDict()  # task_id -> TaskRecord，按最近访问排序
+        self.expires = {}             # task_id -> 过期时间
+        self._heap = []               # (过期时间, task_id)，可能含已失效的旧条目
+
+    def _set_expiry(self, task_id, expires_at):
+        self.expires[task_id] = expires_at
+        heapq.heappush(self._heap, (expires_at, task_id))
+
+    def _delete(self, task_id):
+        self.results.pop(task_id, None)
+        self.expires.pop(task_id, None)
+
+    async def save(self, task_id, task_type, record):
+        self.results[task_id] = record
+        self.results.move_to_end(task_id)
+        self._set_expiry(task_id, time.time() + self.ttl.for_record(record))
+        while len(self.results) > self.ttl.max_entries:
+            oldest, _ = self.results.popitem(last=False)
+            self.expires.pop(oldest, None)
+        if len(self._heap) > 2 * len(self.results) + 1024:
+            # 覆盖写入留下的旧堆条目过多时重建
+            self._heap = [(expires_at, tid) for tid, expires_at in self.expires.items()]
+            heapq.heapify(self._heap)
+
+    async def load(self, task_id, consume=False):
+        record = self.results.get(task_id)
+        if record is None:
+            return None
+        now = time.time()
+        if self.expires[task_id] <= now:
+            self._delete(task_id)
+            return None
+        self.results.move_to_end(task_id)
+        if consume and record.is_final:
+            consumed_at = now + self.ttl.consumed
+            if consumed_at < self.expires[task_id]:
+                self._set_expiry(task_id, consumed_at)
+        return record
+
+    async def cleanup(self):
+        now = time.time()
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, task_id = heapq.heappop(self._heap)
+            if self.expires.get(task_id) == expires_at:
+                self._delete(task_id)
+                removed += 1
+        return removed
+
+    async def close(self):
+        pass
+
+
+class SQLiteStore:
+    """SQLite (WAL) 存储，重启后结果仍在，多个进程可共享同一个文件
+
+    写入先进入内存缓冲，按批次在专用线程中提交；读取优先命中缓冲，
+    所有数据库操作都不阻塞事件循环。过期记录按 expire_time 索引删除，
+    超出条目上限时先淘汰最早过期的记录。
+
+    行数只在启动、近似行数超过上限或每隔 ROW_RECOUNT_INTERVAL 秒时用
+    COUNT(*) 精确统计，平时的清理不扫描全表。
+    """
+
+    def __init__(self, path, ttl: ResultTTL, batch_interval=0.05, batch_size=500):
+        self.path = path
+        self.ttl = ttl
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="results-db")
+        self._conn = None
+        self._pending = {}         # task_id -> (task_type, record, create_time, expire_time)，尚未提交
+        self._flushing = {}        # 正在提交的批次
+        self._expire_updates = {}  # task_id -> 提前的过期时间 (已提交的记录被取走)
+        self._flush_task = None
+        self._batch_full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._rows = 0             # 近似行数: 每写入一行加一 (更新已有行也算)，所以只会偏大
+        self._counted_at = 0.0     # 上次精确统计行数的时间
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "task_id TEXT PRIMARY KEY, task_type TEXT, data TEXT NOT NULL, create_time REAL NOT NULL, expire_time REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        if 'expire_time' not in columns:
+            # 旧版本建的表没有 expire_time，已有记录视为过期
+            conn.execute("ALTER TABLE results ADD COLUMN expire_time REAL NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_expire_time ON results (expire_time)")
+        conn.commit()
+        self._conn = conn
+        self._count_rows(time.time())
+
+    def _count_rows(self, now):
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        self._counted_at = now
+
+    async def open(self):
+        await self._run(self._open)
+
+    def _buffered(self, task_id):
+        return self._pending.get(task_id) or self._flushing.get(task_id)
+
+    def _schedule_flush(self):
+        if len(self._pending) + len(self._expire_updates) >= self.batch_size:
+            self._batch_full.set()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def save(self, task_id, task_type, record):
+        now = time.time()
+        # 同一批次内多次更新时保留最初的创建时间
+        previous = self._buffered(task_id)
+        created = previous[2] if previous else record.create_time
+        self._pending[task_id] = (task_type, record, created, now + self.ttl.for_record(record))
+        self._expire_updates.pop(task_id, None)
+        self._schedule_flush()
+
+    async def _flush_later(self):
+        try:
+            await asyncio.wait_for(self._batch_full.wait(), self.batch_interval)
+        except asyncio.TimeoutError:
+            pass
+        await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._flush_task = None
+            self._batch_full.clear()
+            if not self._pending and not self._expire_updates:
+                return
+            batch, self._pending = self._pending, {}
+            updates, self._expire_updates = self._expire_updates, {}
+            self._flushing = batch
+            rows = [(tid, task_type, json.dumps(record.to_dict()), created, expires) for tid, (task_type, record, created, expires) in batch.items()]
+            try:
+                await self._run(self._write, rows, [(expires, tid) for tid, expires in updates.items()])
+            except Exception as e:
+                # 提交失败时放回缓冲，下次再写
+                print(f"[系统] 结果写入数据库失败: {e}")
+                for tid, entry in batch.items():
+                    self._pending.setdefault(tid, entry)
+                for tid, expires in updates.items():
+                    self._expire_updates.setdefault(tid, expires)
+            finally:
+                self._flushing = {}
+
+    def _write(self, rows, expire_updates):
+        # 更新已有任务时保留最初的创建时间
+        self._conn.executemany(
+            "INSERT INTO results (task_id, task_type, data, create_time, expire_time) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(task_id) DO UPDATE SET task_type = excluded.task_type, data = excluded.data, expire_time = excluded.expire_time",
+            rows
+        )
+        if expire_updates:
+            self._conn.executemany("UPDATE results SET expire_time = MIN(expire_time, ?) WHERE task_id = ?", expire_updates)
+        self._conn.commit()
+        self._rows += len(rows)
+
+    def _read(self, task_id, now):
+        row = self._conn.execute("SELECT data FROM results WHERE task_id = ? AND expire_time > ?", (task_id, now)).fetchone()
+        return TaskRecord.from_dict(json.loads(row[0])) if row else None
+
+    async def load(self, task_id, consume=False):
+        now = time.time()
+        entry = self._buffered(task_id)
+        if entry:
+            task_type, record, created, expires = entry
+            if expires <= now:
+                return None
+        else:
+            record = await self._run(self._read, task_id, now)
+            if record is None:
+                return None
+            expires = None
+        if consume and record.is_final:
+            consumed_at = now + self.ttl.consumed
+            if entry:
+                if consumed_at < expires:
+                    self._pending[task_id] = (task_type, record, created, consumed_at)
+                    self._schedule_flush()
+            elif consumed_at < self._expire_updates.get(task_id, float('inf')):
+                self._expire_updates[task_id] = consumed_at
+                self._schedule_flush()
+        return record
+
+    def _expire(self, now):
+        removed = self._conn.execute("DELETE FROM results WHERE expire_time <= ?", (now,)).rowcount
+        self._rows = max(self._rows - removed, 0)
+        # 近似行数偏大，超过上限时先精确统计再决定是否淘汰；其他进程写入的行靠定期统计发现
+        if self._rows > self.ttl.max_entries or now - self._counted_at >= ROW_RECOUNT_INTERVAL:
+            self._count_rows(now)
+            excess = self._rows - self.ttl.max_entries
+            if excess > 0:
+                evicted = self._conn.execute(
+                    "DELETE FROM results WHERE task_id IN (SELECT task_id FROM results ORDER BY expire_time LIMIT ?)",
+                    (excess,)
+                ).rowcount
+                self._rows -= evicted
+                removed += evicted
+        self._conn.commit()
+        return removed
+
+    async def cleanup(self):
+        await self.flush()
+        return await self._run(self._expire, time.time())
+
+    async def close(self):
+        await self.flush()
+        if self._conn:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+
+# 当前使用的存储，init_db 之前默认为内存模式
+_store = MemoryStore(ResultTTL())
+
+
+async def init_db(path: Optional[str] = None, ttl: Optional[ResultTTL] = None):
+    # 指定 path 时使用 SQLite 文件存储，否则使用内存存储
+    global _store
+    ttl = ttl or ResultTTL()
+    if path:
+        store = SQLiteStore(path, ttl)
+        await store.open()
+        _store = store
+        print(f"[系统] 结果数据库初始化成功 (SQLite: {path})")
+    else:
+        _store = MemoryStore(ttl)
+        print("[系统] 结果数据库初始化成功 (内存模式)")
+
+async def save_result(task_id, task_type, record: TaskRecord):
+    await _store.save(task_id, task_type, record)
+
+async def load_result(task_id, consume=False) -> Optional[TaskRecord]:
+    # consume=True 表示结果已交给客户端，完成的结果随后很快过期
+    return await _store.load(task_id, consume)
+
+async def cleanup_old_results():
+    # 删除已过期的结果，只处理到期的条目
+    return await _store.cleanup()
+
+async def close_db():
+    await _store.close()
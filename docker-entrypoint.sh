@@ -15,7 +15,15 @@ done
 echo "Xvfb started successfully"
 
 # 构建启动命令
-CMD="python api_solver.py --host 0.0.0.0 --port 5072 --browser_type camoufox --thread ${THREAD_COUNT:-2}"
+CMD="python api_solver.py --host 0.0.0.0 --port 5072 --browser_type camoufox --thread ${THREAD_COUNT:-2} --workers ${WORKERS:-1}"
+
+# 设置了 MIN_THREADS/MAX_THREADS 时按需伸缩浏览器池
+if [ -n "$MIN_THREADS" ]; then
+    CMD="$CMD --min-threads $MIN_THREADS"
+fi
+if [ -n "$MAX_THREADS" ]; then
+    CMD="$CMD --max-threads $MAX_THREADS"
+fi
 
 # 如果设置了 API_KEY，添加到命令
 if [ -n "$API_KEY" ]; then
@@ -0,0 +1,174 @@
+import math
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+# Seconds; covers context setup (tens of ms) up to a full failed solve
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def snapshot(self) -> dict:
+        return dict(self.values)
+
+    @staticmethod
+    def merge(into: dict, values: dict) -> None:
+        for label_values, value in values.items():
+            into[label_values] = into.get(label_values, 0) + value
+
+    def samples(self, values: dict):
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.values: Dict[Labels, list] = {}  # labels -> [per-bucket counts..., sum]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * len(self.buckets) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-1] += value
+
+    def snapshot(self) -> dict:
+        return {label_values: list(series) for label_values, series in self.values.items()}
+
+    @staticmethod
+    def merge(into: dict, values: dict) -> None:
+        for label_values, series in values.items():
+            mine = into.setdefault(label_values, [0] * len(series))
+            for i, value in enumerate(series):
+                mine[i] += value
+
+    def samples(self, values: dict):
+        for label_values, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(round(series[-1], 6))}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+class Gauge:
+    """Read at scrape time from ``read``, which returns {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], dict], labels: Labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.read = read
+
+    def snapshot(self) -> dict:
+        return self.read()
+
+    def samples(self, values: dict):
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class SolverMetrics:
+    """Counters and histograms of the solve pipeline, updated as tasks run.
+
+    Worker processes send ``snapshot()`` to the front process, which adds
+    them to its own values when rendering ``/metrics``.
+    """
+
+    def __init__(self):
+        self.queue_wait = Histogram("turnstile_queue_wait_seconds", "Time a task waited for a free browser")
+        self.context_setup = Histogram("turnstile_context_setup_seconds", "Time to get a browser context and page ready", ("warm",))
+        self.navigation = Histogram("turnstile_navigation_seconds", "Time to load the target origin", ("mode",))
+        self.token_wait = Histogram("turnstile_token_wait_seconds", "Time from widget injection to token")
+        self.solve = Histogram("turnstile_solve_seconds", "Total solve time on a browser", ("result",))
+        self.solves = Counter("turnstile_solves_total", "Finished solves", ("result",))
+        self.failures = Counter("turnstile_failures_total", "Failed tasks by cause", ("cause",))
+        self.clicks = Counter("turnstile_click_attempts_total", "Widget click attempts by strategy", ("strategy",))
+        self.proxy_errors = Counter("turnstile_proxy_errors_total", "Solves through a proxy that failed", ("cause",))
+        self.stock_hits = Counter("turnstile_stock_hits_total", "Tasks answered from the token stock")
+        self.gauges = []
+
+    @property
+    def collectors(self):
+        return [self.queue_wait, self.context_setup, self.navigation, self.token_wait, self.solve,
+                self.solves, self.failures, self.clicks, self.proxy_errors, self.stock_hits] + self.gauges
+
+    def gauge(self, name: str, help: str, read: Callable[[], dict], labels: Labels = ()) -> None:
+        self.gauges.append(Gauge(name, help, read, labels))
+
+    def failure(self, cause: str, proxy: Optional[str] = None) -> None:
+        self.failures.inc(cause)
+        if proxy:
+            self.proxy_errors.inc(cause)
+
+    def snapshot(self) -> dict:
+        """Counter and histogram values, picklable for the worker event queue."""
+        return {collector.name: collector.snapshot() for collector in self.collectors if collector.kind != "gauge"}
+
+    def combine(self, snapshots: Iterable[dict]) -> dict:
+        """Sum several ``snapshot()`` values into one."""
+        snapshots = list(snapshots)
+        combined = {}
+        for collector in self.collectors:
+            if collector.kind == "gauge":
+                continue
+            values = combined[collector.name] = {}
+            for snapshot in snapshots:
+                collector.merge(values, snapshot.get(collector.name, {}))
+        return combined
+
+    def render(self, others: Iterable[dict] = ()) -> str:
+        """Prometheus text exposition of this process plus worker ``snapshot()`` values."""
+        others = list(others)
+        lines = []
+        for collector in self.collectors:
+            values = collector.snapshot()
+            if collector.kind != "gauge":
+                for other in others:
+                    collector.merge(values, other.get(collector.name, {}))
+            lines.append(f"# HELP {collector.name} {collector.help}")
+            lines.append(f"# TYPE {collector.name} {collector.kind}")
+            lines.extend(collector.samples(values))
+        return "\n".join(lines) + "\n"
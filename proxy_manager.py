@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+
+# Seconds between checks of the proxy file for changes
+RELOAD_INTERVAL = 5
+# Consecutive failures after which a proxy is quarantined
+FAILURE_THRESHOLD = 3
+
+
+def _logger() -> logging.Logger:
+    # Looked up lazily: api_solver registers its CustomLogger class after importing this module
+    return logging.getLogger("TurnstileAPIServer")
+
+
+def parse_proxy(line: str) -> dict:
+    """Turn a proxies.txt line into Playwright proxy settings.
+
+    Accepted formats: ``scheme://user:pass@ip:port``, ``scheme:ip:port:user:pass``
+    and ``scheme:ip:port``.
+    """
+    if '@' in line:
+        try:
+            scheme, rest = line.split('://')
+            auth, address = rest.split('@')
+            username, password = auth.split(':')
+            ip, port = address.split(':')
+        except ValueError:
+            raise ValueError(f"Invalid proxy format: {line}")
+        return {"server": f"{scheme}://{ip}:{port}", "username": username, "password": password}
+
+    parts = line.split(':')
+    if len(parts) == 5:
+        scheme, ip, port, username, password = parts
+        return {"server": f"{scheme}://{ip}:{port}", "username": username, "password": password}
+    if len(parts) == 3:
+        return {"server": line}
+    raise ValueError(f"Invalid proxy format: {line}")
+
+
+class ProxyEntry:
+    __slots__ = ("line", "options", "successes", "failures", "consecutive_failures", "latency", "quarantined_until", "quarantines")
+
+    def __init__(self, line: str, options: dict):
+        self.line = line
+        self.options = options
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None  # moving average of solve time in seconds
+        self.quarantined_until = 0.0
+        self.quarantines = 0
+
+    def score(self) -> float:
+        # Smoothed success rate per second of latency; unknown proxies start neutral
+        success_rate = (self.successes + 1) / (self.successes + self.failures + 2)
+        return success_rate / max(self.latency or 5.0, 0.5)
+
+    def stats(self, now: float) -> dict:
+        total = self.successes + self.failures
+        return {
+            "server": self.options["server"],
+            "username": self.options.get("username"),
+            "successes": self.successes,
+            "failures": self.failures,
+            "success_rate": round(self.successes / total, 3) if total else None,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "quarantined": self.quarantined_until > now,
+            "quarantines": self.quarantines
+        }
+
+
+class ProxyManager:
+    """In-memory proxy pool built from proxies.txt.
+
+    The file is parsed once and re-read when it changes. Proxies are picked
+    weighted by success rate and latency; one failing ``FAILURE_THRESHOLD``
+    times in a row is skipped for ``quarantine`` seconds. With ``sticky``
+    every sitekey keeps using the proxy it got first while that proxy is
+    healthy.
+    """
+
+    def __init__(self, path: str, sticky: bool = False, quarantine: float = 60, debug: bool = False):
+        self.path = path
+        self.sticky = sticky
+        self.quarantine = quarantine
+        self.debug = debug
+        self.entries: Dict[str, ProxyEntry] = {}
+        self.invalid = 0
+        self._assigned: Dict[str, str] = {}  # sitekey -> proxy line
+        self._mtime = None
+        self.reloads = 0
+
+    def _read(self):
+        """Parse the proxy file; returns None if it has not changed since the last load."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self._mtime == 0:
+                return None  # Still missing, already applied as empty
+            _logger().warning(f"Proxy file not found: {self.path}")
+            self._mtime = 0
+            return {}, 0
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+
+        parsed, invalid = {}, 0
+        with open(self.path) as proxy_file:
+            for line in proxy_file:
+                line = line.strip()
+                if not line or line.startswith('#') or line in parsed:
+                    continue
+                try:
+                    parsed[line] = parse_proxy(line)
+                except ValueError as e:
+                    invalid += 1
+                    _logger().warning(f"Skipping proxy: {str(e)}")
+        return parsed, invalid
+
+    def _apply(self, result) -> None:
+        if result is None:
+            return
+        parsed, self.invalid = result
+        # Keep health stats of proxies that are still listed
+        self.entries = {line: self.entries.get(line) or ProxyEntry(line, options) for line, options in parsed.items()}
+        self._assigned = {sitekey: line for sitekey, line in self._assigned.items() if line in self.entries}
+        self.reloads += 1
+        _logger().info(f"Loaded {len(self.entries)} proxies from {self.path}" + (f" ({self.invalid} invalid lines skipped)" if self.invalid else ""))
+
+    def load(self) -> None:
+        self._apply(self._read())
+
+    async def run(self) -> None:
+        """Reload the proxy file whenever it changes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            try:
+                self._apply(await loop.run_in_executor(None, self._read))
+            except Exception as e:
+                _logger().error(f"Error reading proxy file: {str(e)}")
+
+    def _healthy(self, now: float) -> List[ProxyEntry]:
+        return [entry for entry in self.entries.values() if entry.quarantined_until <= now]
+
+    def pick(self, sitekey: Optional[str] = None) -> Optional[str]:
+        """Choose a proxy line, None when the pool is empty."""
+        if not self.entries:
+            return None
+        now = time.time()
+        if self.sticky and sitekey:
+            line = self._assigned.get(sitekey)
+            entry = self.entries.get(line) if line else None
+            if entry and entry.quarantined_until <= now:
+                return line
+
+        candidates = self._healthy(now)
+        if candidates:
+            entry = random.choices(candidates, weights=[candidate.score() for candidate in candidates])[0]
+        else:
+            # Everything is quarantined: use the one that gets out first
+            entry = min(self.entries.values(), key=lambda candidate: candidate.quarantined_until)
+
+        if self.sticky and sitekey:
+            self._assigned[sitekey] = entry.line
+        return entry.line
+
+    def options(self, line: str) -> dict:
+        entry = self.entries.get(line)
+        return dict(entry.options) if entry else parse_proxy(line)
+
+    def report(self, line: Optional[str], ok: bool, latency: Optional[float] = None) -> None:
+        """Record the outcome of a solve that went through ``line``."""
+        entry = self.entries.get(line) if line else None
+        if entry is None:
+            return
+        if ok:
+            entry.successes += 1
+            entry.consecutive_failures = 0
+            if latency is not None:
+                entry.latency = latency if entry.latency is None else 0.8 * entry.latency + 0.2 * latency
+            return
+
+        entry.failures += 1
+        entry.consecutive_failures += 1
+        if entry.consecutive_failures >= FAILURE_THRESHOLD:
+            entry.consecutive_failures = 0
+            entry.quarantined_until = time.time() + self.quarantine
+            entry.quarantines += 1
+            _logger().warning(f"Proxy {entry.options['server']}: {FAILURE_THRESHOLD} failures in a row, quarantined for {self.quarantine:.0f}s")
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "total": len(self.entries),
+            "healthy": len(self._healthy(now)),
+            "invalid_lines": self.invalid,
+            "sticky_sitekeys": len(self._assigned),
+            "reloads": self.reloads,
+            "proxies": [entry.stats(now) for entry in self.entries.values()]
+        }
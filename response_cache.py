@@ -0,0 +1,165 @@
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+# Static assets worth keeping; anything else goes straight to the network
+CACHEABLE_URL = re.compile(r"^https?://[^?#]+\.(?:js|mjs|css|woff2?|ttf|otf|png|jpe?g|gif|svg|webp|ico)(?:[?#]|$)", re.IGNORECASE)
+# Entry headers not replayed on fulfill: the stored body is already decoded
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive", "set-cookie"}
+
+
+def _logger() -> logging.Logger:
+    # Looked up lazily: api_solver registers its CustomLogger class after importing this module
+    return logging.getLogger("TurnstileAPIServer")
+
+
+def freshness(headers: dict) -> Optional[float]:
+    """Seconds a response may be served from cache per its headers, None if it must not be stored."""
+    cache_control = headers.get("cache-control", "").lower()
+    directives = {}
+    for part in cache_control.split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+    if {"no-store", "no-cache", "private"} & directives.keys():
+        return None
+    vary = headers.get("vary", "").lower().replace(" ", "")
+    if vary and vary != "accept-encoding":
+        return None
+
+    age = headers.get("age", "")
+    age = int(age) if age.isdigit() else 0
+    for name in ("s-maxage", "max-age"):
+        value = directives.get(name, "")
+        if value.isdigit():
+            return int(value) - age
+    if "expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+            date = parsedate_to_datetime(headers["date"]).timestamp() if "date" in headers else time.time()
+        except (TypeError, ValueError):
+            return None
+        return expires - date
+    return None
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "expires_at")
+
+    def __init__(self, status: int, headers: dict, body: bytes, expires_at: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Process-wide LRU of static responses, shared by every context and browser.
+
+    Responses are captured from the browser's own network traffic, so misses
+    cost nothing extra, and repeat requests are answered with
+    ``route.fulfill`` without touching the network. Only GET 200 responses
+    whose Cache-Control/Expires headers allow it are stored, for as long as
+    the headers allow; the total body size stays under ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int, debug: bool = False):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8
+        self.debug = debug
+        self._entries = OrderedDict()  # url -> CachedResponse
+        self._loading = set()
+        self._tasks = set()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    async def attach(self, context) -> None:
+        """Serve and fill the cache for every page of ``context``."""
+        context.on("response", self._on_response)
+        await context.route(CACHEABLE_URL, self.handle)
+
+    def _get(self, url: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(url)
+            return None
+        self._entries.move_to_end(url)
+        return entry
+
+    def _remove(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry:
+            self.bytes -= len(entry.body)
+
+    async def handle(self, route) -> None:
+        """Route handler: fulfill from cache or let the request through."""
+        request = route.request
+        entry = self._get(request.url) if request.method == "GET" else None
+        if entry is None:
+            self.misses += 1
+            await route.fallback()
+            return
+        self.hits += 1
+        self.bytes_saved += len(entry.body)
+        await route.fulfill(status=entry.status, headers=entry.headers, body=entry.body)
+
+    def _on_response(self, response) -> None:
+        url = response.url
+        if response.status != 200 or url in self._loading or url in self._entries or not CACHEABLE_URL.match(url):
+            return
+        if response.request.method != "GET":
+            return
+        ttl = freshness(response.headers)
+        if not ttl or ttl <= 0:
+            return
+        self._loading.add(url)
+        task = asyncio.create_task(self._store(response, ttl))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _store(self, response, ttl: float) -> None:
+        url = response.url
+        try:
+            body = await response.body()
+        except Exception as e:
+            if self.debug:
+                _logger().debug(f"Response cache: Could not read {url}: {str(e)}")
+            return
+        finally:
+            self._loading.discard(url)
+        if len(body) > self.max_entry_bytes:
+            return
+
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _DROP_HEADERS}
+        self._remove(url)
+        self._entries[url] = CachedResponse(response.status, headers, body, time.time() + ttl)
+        self.bytes += len(body)
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        if self.debug:
+            _logger().debug(f"Response cache: Stored {url} ({len(body)} bytes, {ttl:.0f}s)")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "bytes_saved": self.bytes_saved
+        }
@@ -0,0 +1,91 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+
+ProfileKey = Tuple[str, str]
+
+# Seconds a site that failed on the origin stub is navigated for real before the stub is tried again
+STUB_RETRY = 3600
+
+
+class SiteProfileCache:
+    """Bounded LRU of the click strategy that last produced a token per (origin, sitekey).
+
+    Also remembers sites where the origin stub did not work, so they are
+    navigated for real instead.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._profiles: "OrderedDict[ProfileKey, str]" = OrderedDict()
+        self._stub_failed: "OrderedDict[ProfileKey, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.confirmed = 0
+        self.wins = Counter()
+        self.stub_solves = 0
+        self.stub_fallbacks = 0
+
+    @staticmethod
+    def key(url: str, sitekey: str) -> ProfileKey:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}", sitekey
+
+    def preferred(self, key: ProfileKey) -> Optional[str]:
+        """Winning strategy for the site, counted as a hit or a miss."""
+        strategy = self._profiles.get(key)
+        if strategy is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._profiles.move_to_end(key)
+        return strategy
+
+    def record(self, key: ProfileKey, strategy: str) -> None:
+        """Remember the strategy that was clicked last before a token arrived."""
+        if self.max_size <= 0:
+            return
+        if self._profiles.get(key) == strategy:
+            self.confirmed += 1
+        self.wins[strategy] += 1
+        self._profiles[key] = strategy
+        self._profiles.move_to_end(key)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    def use_stub(self, key: ProfileKey) -> bool:
+        """Whether the site may be solved on the origin stub."""
+        failed_at = self._stub_failed.get(key)
+        if failed_at is None:
+            return True
+        if time.time() - failed_at < STUB_RETRY:
+            return False
+        del self._stub_failed[key]
+        return True
+
+    def record_stub(self, key: ProfileKey, solved: bool) -> None:
+        if solved:
+            self.stub_solves += 1
+            return
+        self.stub_fallbacks += 1
+        self._stub_failed[key] = time.time()
+        self._stub_failed.move_to_end(key)
+        while len(self._stub_failed) > max(self.max_size, 1):
+            self._stub_failed.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._profiles),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "confirmed": self.confirmed,
+            "wins": dict(self.wins),
+            "stub_solves": self.stub_solves,
+            "stub_fallbacks": self.stub_fallbacks,
+            "stub_disabled_sites": len(self._stub_failed)
+        }
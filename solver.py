@@ -9,12 +9,13 @@ API:
         返回: {"taskId": "xxx"}
     
     POST /getTaskResult  
-        {"taskId": "xxx"}
+        {"taskId": "xxx", "wait": 20}
         返回: {"status": "ready", "solution": {"token": "xxx"}}
+        wait 可选，任务未完成时服务端最多等待 wait 秒再返回 (长轮询)
     
     兼容旧版 API:
     GET /turnstile?url=xxx&sitekey=xxx
-    GET /result?id=xxx
+    GET /result?id=xxx[&wait=20]
 
 用法:
     python solver.py --port 5072 --thread 2
@@ -36,6 +37,7 @@ from camoufox.async_api import AsyncCamoufox
 DEFAULT_PORT = 5072
 DEFAULT_THREADS = 2
 DEFAULT_TIMEOUT = 60
+MAX_RESULT_WAIT = 30  # 长轮询最长等待秒数
 
 # ================= 日志 =================
 class ColorLogger:
@@ -70,16 +72,37 @@ logger = ColorLogger()
 
 # ================= 内存数据库 =================
 results_db = {}
+result_waiters = {}  # task_id -> Future，任务结束时唤醒长轮询请求
 
 async def save_result(task_id: str, data: dict):
     results_db[task_id] = {
         **data,
         'createTime': time.time()
     }
+    if data.get('status') == 'processing':
+        result_waiters.setdefault(task_id, asyncio.get_running_loop().create_future())
+    else:
+        waiter = result_waiters.pop(task_id, None)
+        if waiter and not waiter.done():
+            waiter.set_result(None)
 
 async def load_result(task_id: str) -> Optional[dict]:
     return results_db.get(task_id)
 
+async def wait_result(task_id: str, wait) -> Optional[dict]:
+    """长轮询: 任务未完成时最多等待 wait 秒，然后返回最新结果"""
+    try:
+        wait = min(max(float(wait or 0), 0), MAX_RESULT_WAIT)
+    except (TypeError, ValueError):
+        wait = 0
+    waiter = result_waiters.get(task_id)
+    if waiter and wait:
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+    return results_db.get(task_id)
+
 async def cleanup_old_results(max_age: int = 300):
     """清理超过 max_age 秒的结果"""
     now = time.time()
@@ -133,7 +156,7 @@ class TurnstileSolver:
                 if not task_id:
                     return jsonify({'error': 'Missing taskId'}), 400
                 
-                result = await load_result(task_id)
+                result = await wait_result(task_id, data.get('wait'))
                 if not result:
                     return jsonify({'error': 'Task not found'}), 404
                 
@@ -180,7 +203,7 @@ class TurnstileSolver:
             if not task_id:
                 return jsonify({'error': 'Missing id'}), 400
             
-            result = await load_result(task_id)
+            result = await wait_result(task_id, request.args.get('wait'))
             if not result:
                 return jsonify({'error': 'Task not found'}), 404
             
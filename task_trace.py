@@ -0,0 +1,90 @@
+import time
+from collections import deque
+from typing import List, Optional
+
+
+class TaskTrace:
+    """Timeline of one solve: stage offsets in seconds from when the task was queued.
+
+    Stages in order of a normal solve: ``queued``, ``acquired`` (browser taken
+    from the pool), ``context_ready``, ``navigated``, ``injected`` and finally
+    ``token`` or ``failed``. A stub solve that falls back adds ``fallback``
+    and a second navigation.
+    """
+
+    __slots__ = ("start", "stages", "browser", "proxy", "mode", "attempts", "clicks", "result")
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = start or time.time()
+        self.stages = [("queued", 0.0)]
+        self.browser = None
+        self.proxy = None
+        self.mode = None
+        self.attempts = 0
+        self.clicks = []  # (strategy or None, offset)
+        self.result = None
+
+    def _offset(self) -> float:
+        return round(time.time() - self.start, 3)
+
+    def mark(self, stage: str) -> None:
+        self.stages.append((stage, self._offset()))
+
+    def click(self, strategy: Optional[str]) -> None:
+        self.clicks.append((strategy, self._offset()))
+
+    def to_dict(self) -> dict:
+        return {
+            "start": round(self.start, 3),
+            "browser": self.browser,
+            "proxy": self.proxy,
+            "mode": self.mode,
+            "attempts": self.attempts,
+            "clicks": [list(click) for click in self.clicks],
+            "stages": [list(stage) for stage in self.stages],
+            "result": self.result
+        }
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class TraceBuffer:
+    """The last ``size`` finished traces, for looking at where time goes across tasks."""
+
+    def __init__(self, size: int = 1000):
+        self.size = size
+        self._traces = deque(maxlen=max(size, 0))
+
+    def append(self, trace: dict) -> None:
+        if self.size > 0:
+            self._traces.append(trace)
+
+    def recent(self, limit: int) -> list:
+        return list(self._traces)[-limit:] if limit > 0 else []
+
+    def summary(self) -> dict:
+        """Per stage: how many traces reached it and the time spent getting there from the previous stage."""
+        durations = {}
+        results = {}
+        for trace in self._traces:
+            results[trace["result"]] = results.get(trace["result"], 0) + 1
+            previous = 0.0
+            for stage, offset in trace["stages"][1:]:
+                durations.setdefault(stage, []).append(offset - previous)
+                previous = offset
+        return {
+            "traces": len(self._traces),
+            "results": results,
+            "stages": {
+                stage: {
+                    "count": len(values),
+                    "avg": round(sum(values) / len(values), 3),
+                    "p50": round(_percentile(values, 0.5), 3),
+                    "p95": round(_percentile(values, 0.95), 3)
+                }
+                for stage, values in durations.items()
+            }
+        }
@@ -0,0 +1,102 @@
+import json
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+StockKey = Tuple[str, str, Optional[str], Optional[str]]
+
+
+class TokenStock:
+    """Pre-solved tokens kept ready per (url, sitekey, action, cdata).
+
+    Tokens are handed out oldest first and dropped once they are older than
+    ``ttl`` seconds, which should stay below Turnstile's 300s validity window
+    so a client still has time to submit the token it receives.
+    """
+
+    def __init__(self, targets: Dict[StockKey, int], ttl: float = 240):
+        self.targets = targets
+        self.ttl = ttl
+        self._tokens: Dict[StockKey, deque] = {key: deque() for key in targets}
+        self._refilling: Dict[StockKey, int] = {key: 0 for key in targets}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None) -> StockKey:
+        return url, sitekey, action or None, cdata or None
+
+    @classmethod
+    def from_file(cls, path: str, ttl: float = 240) -> "TokenStock":
+        """Load targets from a JSON list of {url, sitekey, action, cdata, count} entries."""
+        with open(path) as stock_file:
+            entries = json.load(stock_file)
+
+        targets = {}
+        for entry in entries:
+            if not entry.get('url') or not entry.get('sitekey'):
+                raise ValueError(f"Stock entry needs 'url' and 'sitekey': {entry}")
+            key = cls.key(entry['url'], entry['sitekey'], entry.get('action'), entry.get('cdata'))
+            targets[key] = int(entry.get('count', 1))
+        return cls(targets, ttl=ttl)
+
+    def _purge(self, key: StockKey, now: float) -> None:
+        tokens = self._tokens[key]
+        while tokens and now - tokens[0][1] > self.ttl:
+            tokens.popleft()
+            self.expired += 1
+
+    def take(self, url: str, sitekey: str, action: Optional[str] = None, cdata: Optional[str] = None) -> Optional[str]:
+        """Pop a fresh token for the tuple, or None if it is not stocked or empty."""
+        key = self.key(url, sitekey, action, cdata)
+        if key not in self._tokens:
+            return None
+
+        self._purge(key, time.time())
+        if not self._tokens[key]:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._tokens[key].popleft()[0]
+
+    def put(self, key: StockKey, token: str, issued_at: Optional[float] = None) -> None:
+        self._tokens[key].append((token, issued_at or time.time()))
+
+    def deficits(self) -> List[Tuple[StockKey, int]]:
+        """Tuples below target, counting refills already in progress."""
+        now = time.time()
+        missing = []
+        for key, target in self.targets.items():
+            self._purge(key, now)
+            shortfall = target - len(self._tokens[key]) - self._refilling[key]
+            if shortfall > 0:
+                missing.append((key, shortfall))
+        return missing
+
+    def refill_started(self, key: StockKey) -> None:
+        self._refilling[key] += 1
+
+    def refill_finished(self, key: StockKey) -> None:
+        self._refilling[key] -= 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "ttl": self.ttl,
+            "entries": [
+                {
+                    "url": key[0],
+                    "sitekey": key[1],
+                    "action": key[2],
+                    "cdata": key[3],
+                    "available": len(self._tokens[key]),
+                    "target": target
+                }
+                for key, target in self.targets.items()
+            ]
+        }
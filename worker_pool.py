@@ -0,0 +1,289 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from task_trace import TaskTrace
+
+
+# How often workers report their pool state to the front process
+HEALTH_INTERVAL = 2
+
+
+def _logger() -> logging.Logger:
+    # Looked up lazily: api_solver registers its CustomLogger class after importing this module
+    return logging.getLogger("TurnstileAPIServer")
+
+
+def split_threads(thread: int, workers: int):
+    """Spread ``thread`` browsers over at most ``workers`` processes, dropping empty ones."""
+    workers = max(1, min(workers, thread))
+    return [thread // workers + (1 if i < thread % workers else 0) for i in range(workers)]
+
+
+class WorkerPool:
+    """Front-process side of multi-process mode.
+
+    The front process owns the HTTP API and result store. Each worker process
+    owns a slice of the browser pool and runs its own event loop. A worker
+    asks for a job whenever it has an idle browser and the front process
+    hands out queued jobs in order, so load balances itself. Every worker has
+    its own job queue, so a crashed worker cannot wedge the others.
+    """
+
+    def __init__(self, workers: int, options: dict):
+        self.options = options
+        self.slices = split_threads(options['thread'], workers)
+        self._ctx = multiprocessing.get_context('spawn')
+        self.event_queue = self._ctx.Queue()
+        self.processes = {}
+        self.snapshots = {}
+        self.metrics = {}             # worker_id -> last SolverMetrics snapshot
+        self.retired_metrics = {}     # metrics of worker processes that exited
+        self.ready = {}               # worker_id -> idle browsers asking for a job
+        self.pending = OrderedDict()  # job id -> job, waiting for a worker
+        self.running = {}             # job id -> worker_id
+        self.stock_jobs = {}          # job id -> stock key
+        self.server = None
+        self._loop = None
+        self._reader = None
+        self._stopping = False
+
+    @property
+    def thread_count(self) -> int:
+        return sum(self.slices)
+
+    def start(self, server) -> None:
+        self.server = server
+        self._loop = asyncio.get_running_loop()
+        offset = 0
+        for worker_id, threads in enumerate(self.slices):
+            self._start_worker(worker_id, threads, offset)
+            offset += threads
+        self._reader = threading.Thread(target=self._read_events, name="worker-events", daemon=True)
+        self._reader.start()
+        _logger().info(f"Started {len(self.slices)} worker processes with {self.slices} browsers")
+
+    def _start_worker(self, worker_id: int, threads: int, offset: int) -> None:
+        # Workers keep a fixed pool: the queue that autoscaling reacts to lives in this process
+        options = dict(self.options, thread=threads, min_threads=threads, max_threads=threads, stock_file=None)
+        job_queue = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(worker_id, options, offset, job_queue, self.event_queue),
+            name=f"turnstile-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self.processes[worker_id] = (process, job_queue, threads, offset)
+        self.ready[worker_id] = 0
+
+    def submit(self, task_id: str, record) -> None:
+        self.pending[task_id] = {
+            "task_id": task_id, "kind": "task", "enqueued_at": time.time(),
+            "url": record.url, "sitekey": record.sitekey, "action": record.action, "cdata": record.cdata
+        }
+        self._assign()
+
+    def idle_browsers(self) -> int:
+        return sum(snapshot.get("pool_size", 0) for snapshot in self.snapshots.values())
+
+    def submit_stock(self, key, reserve: int) -> bool:
+        """Queue a stock refill job if the workers report spare idle browsers."""
+        if self.pending or self.idle_browsers() - len(self.stock_jobs) <= reserve:
+            return False
+        job_id = f"stock-{uuid.uuid4()}"
+        self.stock_jobs[job_id] = key
+        url, sitekey, action, cdata = key
+        self.pending[job_id] = {
+            "task_id": job_id, "kind": "stock", "enqueued_at": time.time(),
+            "url": url, "sitekey": sitekey, "action": action, "cdata": cdata
+        }
+        self._assign()
+        return True
+
+    def _assign(self) -> None:
+        """Hand queued jobs to workers that asked for one, oldest job first."""
+        for worker_id, (process, job_queue, _, _) in self.processes.items():
+            if not process.is_alive():
+                continue
+            while self.ready[worker_id] and self.pending:
+                job_id, job = self.pending.popitem(last=False)
+                self.ready[worker_id] -= 1
+                self.running[job_id] = worker_id
+                if job["kind"] == "task":
+                    self.server.queue_depth -= 1
+                    self.server.metrics.queue_wait.observe(time.time() - job["enqueued_at"])
+                job_queue.put(job)
+
+    def _read_events(self) -> None:
+        """Blocking reader thread handing worker events to the event loop."""
+        while True:
+            try:
+                event = self.event_queue.get()
+            except (EOFError, OSError):
+                return
+            if event is None:
+                return
+            self._loop.call_soon_threadsafe(self._handle_event, event)
+
+    def _handle_event(self, event) -> None:
+        kind = event[0]
+        server = self.server
+        if kind == "ready":
+            _, worker_id = event
+            if worker_id in self.ready:
+                self.ready[worker_id] += 1
+                self._assign()
+        elif kind == "result":
+            _, job_id, token, elapsed_time, trace = event
+            if self.running.pop(job_id, None) is None:
+                return
+            if job_id in self.stock_jobs:
+                self._finish_stock(job_id, token)
+                return
+            server._observe_solve_time(elapsed_time or 0)
+            server._spawn(server._finish_task(job_id, token, elapsed_time, trace=trace))
+        elif kind == "health":
+            _, worker_id, snapshot = event
+            self.snapshots[worker_id] = snapshot
+        elif kind == "metrics":
+            _, worker_id, snapshot = event
+            if worker_id in self.processes:
+                self.metrics[worker_id] = snapshot
+
+    def _finish_stock(self, job_id: str, token: Optional[str] = None) -> None:
+        key = self.stock_jobs.pop(job_id)
+        if self.server.token_stock:
+            if token:
+                self.server.token_stock.put(key, token)
+            self.server.token_stock.refill_finished(key)
+
+    async def supervise(self) -> None:
+        """Expire jobs no worker picked up in time and restart dead workers."""
+        server = self.server
+        while not self._stopping:
+            await asyncio.sleep(1)
+            now = time.time()
+            if server.queue_timeout:
+                for job_id, job in list(self.pending.items()):
+                    if now - job["enqueued_at"] <= server.queue_timeout:
+                        break
+                    del self.pending[job_id]
+                    if job_id in self.stock_jobs:
+                        self._finish_stock(job_id)
+                        continue
+                    server.queue_depth -= 1
+                    server.metrics.queue_wait.observe(now - job["enqueued_at"])
+                    await server._finish_task(job_id, None, round(now - job["enqueued_at"], 3), "ERROR_NO_SLOT_AVAILABLE")
+
+            for worker_id, (process, _, threads, offset) in list(self.processes.items()):
+                if process.is_alive() or self._stopping:
+                    continue
+                _logger().error(f"Worker {worker_id} exited with code {process.exitcode}, restarting")
+                self.snapshots.pop(worker_id, None)
+                # Keep the counters of the dead worker so totals never go down
+                self.retired_metrics = server.metrics.combine([self.retired_metrics, self.metrics.pop(worker_id, {})])
+                for job_id, owner in list(self.running.items()):
+                    if owner != worker_id:
+                        continue
+                    del self.running[job_id]
+                    if job_id in self.stock_jobs:
+                        self._finish_stock(job_id)
+                    else:
+                        server.metrics.failure("worker_exit")
+                        await server._finish_task(job_id, None, 0)
+                self._start_worker(worker_id, threads, offset)
+
+    def metric_snapshots(self) -> list:
+        return [self.retired_metrics] + list(self.metrics.values())
+
+    def health(self) -> dict:
+        workers = []
+        for worker_id, (process, _, threads, _) in sorted(self.processes.items()):
+            snapshot = self.snapshots.get(worker_id, {})
+            workers.append(dict(snapshot, worker_id=worker_id, pid=process.pid, alive=process.is_alive(), thread_count=threads))
+        return {
+            "pool_size": self.idle_browsers(),
+            "running": len(self.running),
+            "workers": workers
+        }
+
+    def stop(self) -> None:
+        self._stopping = True
+        for _, job_queue, _, _ in self.processes.values():
+            job_queue.put(None)
+        for process, _, _, _ in self.processes.values():
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.event_queue.put(None)
+
+
+def worker_main(worker_id: int, options: dict, index_offset: int, job_queue, event_queue) -> None:
+    """Entry point of a worker process."""
+    asyncio.run(_worker_loop(worker_id, options, index_offset, job_queue, event_queue))
+
+
+async def _worker_loop(worker_id: int, options: dict, index_offset: int, job_queue, event_queue) -> None:
+    # Imported here: api_solver imports this module
+    from api_solver import TurnstileAPIServer
+
+    server = TurnstileAPIServer(**options)
+    server.index_offset = index_offset
+    await server._initialize_browser()
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    held = None  # slot of the browser held while asking for a job
+
+    async def report_health():
+        while True:
+            snapshot = server._pool_health()
+            if held is not None:
+                # The browser held while asking for a job is idle, not busy
+                snapshot["pool_size"] += 1
+                browsers = snapshot["browsers"]
+                browsers["states"]["busy"] -= 1
+                browsers["states"]["idle"] += 1
+                for slot in browsers["slots"]:
+                    if slot["index"] == held[0]:
+                        slot["state"] = "idle"
+            event_queue.put(("health", worker_id, snapshot))
+            event_queue.put(("metrics", worker_id, server.metrics.snapshot()))
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    async def run_job(slot, job):
+        index, browser, browser_config = slot
+        trace = TaskTrace(job["enqueued_at"])
+        trace.mark("acquired")
+        try:
+            token, elapsed_time = await server._run_solve(index, browser, browser_config, job["url"], job["sitekey"], job["action"], job["cdata"], trace)
+        except Exception as e:
+            _logger().error(f"Worker {worker_id}: Unexpected error solving task {job['task_id']}: {str(e)}")
+            token, elapsed_time = None, 0
+        event_queue.put(("result", job["task_id"], token, elapsed_time, trace.to_dict()))
+
+    server._spawn(report_health())
+
+    while True:
+        # Only ask for a job once a browser is free
+        slot = await server.browser_supervisor.acquire()
+        held = slot
+        event_queue.put(("ready", worker_id))
+        try:
+            job = await loop.run_in_executor(executor, job_queue.get)
+        except (EOFError, OSError):
+            job = None
+        held = None
+        if job is None:
+            server.browser_supervisor.release(slot[0], slot[1])
+            break
+        server._spawn(run_job(slot, job))
+
+    executor.shutdown(wait=False)